@@ -0,0 +1,51 @@
+from django.utils import timezone
+
+from .models import Payment, PostCache, Reblog
+from .serializers import (
+    BlockReblogSerializer, FeedPostSerializer, PaymentSerializer,
+    ValuesSerializer
+)
+
+
+def get_block_contents(blocks):
+    """
+    Returns the posts, payments and reblogs of the given blocks, keyed by
+    block number.
+
+    Hivemind stamps posts and reblogs with the timestamp of their block
+    and payments with its number, so each kind is fetched with a single
+    range query regardless of the number of blocks.
+    """
+    contents = {
+        block.num: {'posts': [], 'payments': [], 'reblogs': []}
+        for block in blocks}
+    if not contents:
+        return contents
+    nums = {block.created_at: block.num for block in blocks}
+    time_range = [min(nums), max(nums)]
+    # hivemind stores naive UTC timestamps
+    time_range = [
+        timezone.make_aware(value, timezone.utc)
+        if timezone.is_naive(value) else value for value in time_range]
+    num_range = (min(contents), max(contents))
+
+    sources = (
+        ('posts', FeedPostSerializer, PostCache.objects.filter(
+            created_at__range=time_range).order_by('post_id'), 'created_at'),
+        ('reblogs', BlockReblogSerializer, Reblog.objects.filter(
+            created_at__range=time_range).order_by('created_at'),
+         'created_at'),
+        ('payments', PaymentSerializer, Payment.objects.filter(
+            block_num__range=num_range).order_by('block_num', 'tx_idx'),
+         'block_num'),
+    )
+    for name, serializer_class, queryset, key in sources:
+        serializer = ValuesSerializer(serializer_class())
+        lookups = serializer.lookups
+        if key not in lookups:
+            lookups.append(key)
+        for row in queryset.values(*lookups):
+            num = row[key] if key == 'block_num' else nums.get(row[key])
+            if num in contents:
+                contents[num][name].append(serializer.to_representation(row))
+    return contents
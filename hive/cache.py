@@ -0,0 +1,150 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import urlencode
+
+from .models import State
+
+HEAD_STATE_KEY = 'tower:head_state'
+
+
+def get_cache():
+    return caches[settings.TOWER_CACHE['ALIAS']]
+
+
+def get_state():
+    """
+    Returns the hive_state row of the last block processed by hivemind as
+    a dict, or None before the first block.
+
+    The row is kept in the cache for HEAD_BLOCK_TTL seconds so that
+    cached responses can be validated, and the prices read, without a
+    query per request.
+    """
+    cache = get_cache()
+    state = cache.get(HEAD_STATE_KEY)
+    if state is None:
+        state = State.objects.order_by('block_num').values(
+            'block_num', 'steem_per_mvest', 'usd_per_steem',
+            'sbd_per_steem').last()
+        if state is not None:
+            cache.set(HEAD_STATE_KEY, state,
+                      settings.TOWER_CACHE['HEAD_BLOCK_TTL'])
+    return state
+
+
+def get_head_block():
+    """
+    Returns the last block processed by hivemind.
+    """
+    state = get_state()
+    return state['block_num'] if state is not None else None
+
+
+def get_request_fingerprint(request):
+    """
+    Returns a digest of the request path and its query parameters. The
+    parameters are sorted, so ?a=1&b=2 and ?b=2&a=1 share a cache entry.
+    """
+    params = sorted(
+        (key, value) for key, values in request.GET.lists()
+        for value in values)
+    normalized = "%s?%s" % (request.path, urlencode(params))
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    A thread-safe, per-process LRU for values that are too big or too hot
+    to go through the shared cache, like parsed vote lists.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class CachedResponseMixin:
+    """
+    Serves GET responses of a viewset from the cache until the head block
+    advances.
+
+    Hivemind data only changes when a new block is processed, so cache
+    entries are tagged with the head block number and old entries simply
+    stop being looked up. Responses carry an ETag derived from the same
+    tag, which lets clients revalidate with If-None-Match and get a 304
+    without the response being rebuilt. Cached responses are replayed
+    with the headers the view set.
+    """
+
+    def get_cache_timeout(self, request):
+        config = settings.TOWER_CACHE
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        return config['TIMEOUTS'].get(url_name, config['TIMEOUT'])
+
+    def dispatch(self, request, *args, **kwargs):
+        timeout = self.get_cache_timeout(request)
+        if request.method != 'GET' or not timeout:
+            return super().dispatch(request, *args, **kwargs)
+
+        block_num = get_head_block()
+        if block_num is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        fingerprint = get_request_fingerprint(request)
+        etag = '"%s-%s"' % (block_num, fingerprint)
+        cache = get_cache()
+        key = 'tower:http:%s:%s' % (block_num, fingerprint)
+        cached = cache.get(key)
+        if cached is not None:
+            # only cached (200) responses are revalidated, so an ETag can't
+            # turn a 404 into a 304
+            content, headers = cached
+            if etag in self._parse_etags(request):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(content)
+                for header, value in headers:
+                    response[header] = value
+                response['X-Cache'] = 'HIT'
+            response['ETag'] = etag
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        cache.set(key, (response.content, list(response.items())), timeout)
+        response['ETag'] = etag
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @staticmethod
+    def _parse_etags(request):
+        header = request.META.get('HTTP_IF_NONE_MATCH', '')
+        return [etag.strip() for etag in header.split(',') if etag.strip()]
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .cache import get_cache, get_head_block
+from .models import Community, Member, Post, PostCache
+
+# The aggregates scan every community post, so they are refreshed once
+# every SUMMARY_INTERVAL blocks (a minute) instead of on every block.
+SUMMARY_INTERVAL = 20
+
+
+def compute_summary():
+    """
+    Returns the subscriber count, post count and pending payout of every
+    community, keyed by name, with one grouped query per aggregate.
+    """
+    names = Community.objects.values('name')
+    summary = {}
+
+    def add(rows, key, field):
+        for row in rows:
+            summary.setdefault(row[key], {})[field] = row[field]
+
+    add(Member.objects.values('community').annotate(
+        subscribers=Count('account')).order_by(),
+        'community', 'subscribers')
+    add(Post.objects.filter(
+        community__in=names, is_deleted=False).values('community').annotate(
+        post_count=Count('id')).order_by(), 'community', 'post_count')
+    add(PostCache.objects.filter(
+        post__community__in=names, is_paidout=False).values(
+        'post__community').annotate(pending_payout=Sum('payout')).order_by(),
+        'post__community', 'pending_payout')
+    return summary
+
+
+def get_summary():
+    """
+    Returns the community aggregates, computed once per SUMMARY_INTERVAL
+    blocks and shared by the workers through the cache.
+    """
+    block_num = get_head_block()
+    if block_num is None:
+        return compute_summary()
+    cache = get_cache()
+    key = 'tower:communities:%s' % (block_num // SUMMARY_INTERVAL)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_summary()
+        cache.set(key, summary, max(
+            settings.TOWER_CACHE['TIMEOUT'], SUMMARY_INTERVAL * 3))
+    return summary
+
+
+def add_community_fields(rows):
+    """
+    Adds subscribers, post_count and pending_payout to a page of
+    community representations.
+    """
+    summary = get_summary() if rows else {}
+    for row in rows:
+        aggregates = summary.get(row['name'], {})
+        row['subscribers'] = aggregates.get('subscribers', 0)
+        row['post_count'] = aggregates.get('post_count', 0)
+        row['pending_payout'] = '%.3f' % aggregates.get('pending_payout', 0)
+    return rows
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections
+from django.http import JsonResponse
+from psycopg2 import errorcodes
+
+
+def get_block_num(alias):
+    """
+    Returns the head block of the given database, or None if it can't be
+    reached.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT MAX(block_num) FROM hive_state")
+            return cursor.fetchone()[0]
+    except DatabaseError:
+        connections[alias].close()
+        return None
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the hive models to the replicas in
+    TOWER_DB['REPLICAS'].
+
+    The replicas are checked every CHECK_INTERVAL seconds. A replica that
+    can't be reached, or that is more than MAX_LAG blocks behind the
+    primary, is skipped until the next check. Each thread sticks to one
+    replica between two checks, so the queries of a request see the same
+    snapshot. Reads go to the primary when no replica is healthy.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.checked_at = None
+        self.healthy = []
+
+    def check_replicas(self):
+        config = settings.TOWER_DB
+        head = get_block_num('default')
+        healthy = []
+        for alias in config['REPLICAS']:
+            block_num = get_block_num(alias)
+            if block_num is None:
+                continue
+            if head is not None and head - block_num > config['MAX_LAG']:
+                continue
+            healthy.append(alias)
+        return healthy
+
+    def get_healthy_replicas(self):
+        interval = settings.TOWER_DB['CHECK_INTERVAL']
+        expired = (self.checked_at is None or
+                   time.monotonic() - self.checked_at >= interval)
+        # a single thread refreshes the list, the others keep using the
+        # previous one meanwhile.
+        if expired and self.lock.acquire(blocking=False):
+            try:
+                self.healthy = self.check_replicas()
+                self.checked_at = time.monotonic()
+            finally:
+                self.lock.release()
+        return self.checked_at, self.healthy
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'hive' or \
+                not settings.TOWER_DB['REPLICAS']:
+            return None
+        checked_at, healthy = self.get_healthy_replicas()
+        if getattr(self.local, 'checked_at', None) != checked_at:
+            self.local.checked_at = checked_at
+            self.local.alias = random.choice(healthy) if healthy else None
+        return self.local.alias
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class QueryTimeoutMiddleware:
+    """
+    Turns the queries cancelled by the statement_timeout into 400
+    responses instead of server errors. Retrying the same request wouldn't
+    help, it has to be narrowed down.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, OperationalError):
+            return None
+        pgcode = getattr(exception.__cause__, 'pgcode', None)
+        if pgcode != errorcodes.QUERY_CANCELED:
+            return None
+        return JsonResponse(
+            {"detail": "The query took too long, try a narrower request.",
+             "code": "query_timeout"},
+            status=400)
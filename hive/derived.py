@@ -0,0 +1,55 @@
+import math
+
+from .cache import get_state
+
+VESTS_PER_MVEST = 1000000
+
+
+def reputation_score(raw):
+    """
+    Converts a raw reputation to the 25 based score shown by the
+    condenser, e.g. 10^12 -> 52.
+    """
+    if raw is None:
+        return None
+    if not raw:
+        return 25.0
+    score = max(math.log10(abs(raw)) - 9, 0) * 9
+    return round(25 + (score if raw > 0 else -score), 2)
+
+
+def vests_to_sp(vests, steem_per_mvest):
+    return vests * steem_per_mvest / VESTS_PER_MVEST
+
+
+def add_account_fields(rows):
+    """
+    Adds reputation_score, and steem_power with its value in USD and SBD
+    at the head block's prices, to a page of account representations.
+    """
+    state = None
+    if any('vote_weight' in row for row in rows):
+        state = get_state()
+    if state is not None:
+        steem_per_mvest = float(state['steem_per_mvest'])
+        usd_per_steem = float(state['usd_per_steem'])
+        sbd_per_steem = float(state['sbd_per_steem'])
+    for row in rows:
+        if 'reputation' in row:
+            row['reputation_score'] = reputation_score(row['reputation'])
+        if 'vote_weight' in row and state is not None:
+            steem_power = vests_to_sp(row['vote_weight'], steem_per_mvest)
+            row['steem_power'] = round(steem_power, 3)
+            row['steem_power_usd'] = round(steem_power * usd_per_steem, 3)
+            row['steem_power_sbd'] = round(steem_power * sbd_per_steem, 3)
+    return rows
+
+
+def add_post_fields(rows):
+    """
+    Adds author_rep_score to a page of post representations.
+    """
+    for row in rows:
+        if 'author_rep' in row:
+            row['author_rep_score'] = reputation_score(row['author_rep'])
+    return rows
@@ -0,0 +1,151 @@
+import logging
+import math
+import select
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.utils.encoders import JSONEncoder
+
+from .blocks import get_block_contents
+from .models import Block, State
+from .serializers import BlockSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class BlockWatcher:
+    """
+    Watches hive_state from a single background thread per process and
+    keeps the last BUFFER_SIZE blocks, with the posts they contain, in
+    memory.
+
+    Subscribers wait on a condition instead of querying the database, so
+    the number of queries doesn't grow with the number of clients. The
+    state is polled every POLL_INTERVAL seconds, or when a notification
+    arrives on the Postgres CHANNEL, if one is configured.
+    """
+
+    def __init__(self):
+        self.events = deque(maxlen=settings.TOWER_EVENTS['BUFFER_SIZE'])
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.listening = False
+
+    def ensure_started(self):
+        with self.lock:
+            # a thread that died is replaced instead of leaving every
+            # client waiting for blocks that never come
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='tower-block-watcher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.check()
+                self.sleep()
+            except Exception:
+                logger.exception("Can't publish the new blocks.")
+                connection.close()
+                self.listening = False
+                time.sleep(settings.TOWER_EVENTS['POLL_INTERVAL'])
+
+    def check(self):
+        """
+        Publishes the blocks processed since the last check.
+        """
+        head = State.objects.order_by('block_num').values_list(
+            'block_num', flat=True).last()
+        last = self.events[-1]['num'] if self.events else None
+        if head is None or (last is not None and head <= last):
+            return
+        first = head - self.events.maxlen + 1
+        if last is not None:
+            first = max(first, last + 1)
+        blocks = list(Block.objects.filter(
+            num__range=(first, head)).order_by('num'))
+        if last is None:
+            blocks = blocks[-1:]
+        contents = get_block_contents(blocks)
+        serializer = BlockSerializer()
+        self.publish([
+            dict(serializer.to_representation(block),
+                 posts=contents[block.num]['posts'])
+            for block in blocks])
+
+    def publish(self, events):
+        if not events:
+            return
+        with self.condition:
+            self.events.extend(events)
+            self.condition.notify_all()
+
+    def sleep(self):
+        config = settings.TOWER_EVENTS
+        if not config['CHANNEL']:
+            time.sleep(config['POLL_INTERVAL'])
+            return
+        if not self.listening:
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN "%s"' % config['CHANNEL'])
+            self.listening = True
+        raw = connection.connection
+        if select.select([raw], [], [], config['POLL_INTERVAL']) != \
+                ([], [], []):
+            raw.poll()
+            del raw.notifies[:]
+
+    def wait(self, after_block=None, timeout=0):
+        """
+        Returns the buffered blocks after after_block, waiting up to
+        timeout seconds for a new one. Without after_block, only the head
+        block is returned. A timeout that is not a finite number doesn't
+        wait at all.
+        """
+        if not math.isfinite(timeout):
+            timeout = 0
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if after_block is None:
+                    events = list(self.events)[-1:]
+                else:
+                    events = [event for event in self.events
+                              if event['num'] > after_block]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+
+
+watcher = BlockWatcher()
+
+
+def encode_sse(events):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    return ''.join(
+        'id: %s\nevent: block\ndata: %s\n\n' % (
+            event['num'], encoder.encode(event))
+        for event in events)
+
+
+def iter_sse(after_block, duration, heartbeat):
+    """
+    Yields server-sent events for the blocks after after_block for
+    duration seconds. Comments are sent every heartbeat seconds of
+    silence to keep proxies from closing the connection.
+    """
+    deadline = time.monotonic() + duration
+    yield 'retry: 3000\n\n'
+    while time.monotonic() < deadline:
+        events = watcher.wait(after_block, timeout=heartbeat)
+        if events:
+            after_block = events[-1]['num']
+            yield encode_sse(events)
+        else:
+            yield ': heartbeat\n\n'
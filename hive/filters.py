@@ -1,6 +1,6 @@
 from django_filters import rest_framework as filters
 from django_filters.rest_framework.backends import DjangoFilterBackend
-from .models import Account
+from .models import Account, Block
 from rest_framework.filters import OrderingFilter
 
 
@@ -57,10 +57,27 @@ class AccountFilter(filters.FilterSet):
     name__contains = filters.CharFilter(field_name="name",
                                         lookup_expr="contains")
 
+    name__startswith = filters.CharFilter(field_name="name",
+                                          lookup_expr="startswith")
+
     class Meta:
         model = Account
         fields = '__all__'
 
 
+class BlockFilter(filters.FilterSet):
+    from_num = filters.NumberFilter(field_name="num", lookup_expr="gte")
+    to_num = filters.NumberFilter(field_name="num", lookup_expr="lte")
+
+    since = filters.IsoDateTimeFilter(field_name="created_at",
+                                      lookup_expr="gte")
+    until = filters.IsoDateTimeFilter(field_name="created_at",
+                                      lookup_expr="lte")
+
+    class Meta:
+        model = Block
+        fields = ('from_num', 'to_num', 'since', 'until')
+
+
 class PostFilter(filters.FilterSet):
     pass
@@ -0,0 +1,129 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import get_cache
+
+# EXPLAIN costs depend on the table statistics, not on the head block, so
+# they are kept for an hour per query shape.
+COST_CACHE_TIMEOUT = 60 * 60
+
+# Lookups a btree index on the column serves. Pattern matches (contains,
+# startswith...) and case-insensitive lookups need other indexes. None
+# stands for ordering by the column.
+INDEXED_LOOKUPS = (
+    None, 'exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull')
+
+
+class QueryTooExpensive(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'This combination of filters and ordering is too ' \
+                     'expensive, use an indexed ordering or narrower filters.'
+    default_code = 'query_too_expensive'
+
+
+def get_query_fields(queryset):
+    """
+    Returns the (field, lookup) pairs the queryset filters by, and the
+    (field, None) pairs it orders by. The field is None for a condition or
+    an ordering that isn't a plain column.
+    """
+    query = queryset.query
+    fields = set()
+    for field in query.order_by or queryset.model._meta.ordering:
+        fields.add(
+            (field.lstrip('-') if isinstance(field, str) else None, None))
+
+    nodes = [query.where]
+    while nodes:
+        node = nodes.pop()
+        for child in node.children:
+            if hasattr(child, 'children'):
+                nodes.append(child)
+            else:
+                target = getattr(getattr(child, 'lhs', None), 'target', None)
+                fields.add((getattr(target, 'name', None),
+                            getattr(child, 'lookup_name', None) or '?'))
+    return fields
+
+
+def get_query_cost(queryset):
+    """
+    Returns the planner's total cost for the queryset. Costs are cached
+    per query shape, the SQL without its parameters.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    cache = get_cache()
+    key = 'tower:cost:%s' % hashlib.md5(
+        repr((queryset.db, sql)).encode('utf-8')).hexdigest()
+    cost = cache.get(key)
+    if cost is None:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        cost = plan[0]['Plan']['Total Cost']
+        cache.set(key, cost, COST_CACHE_TIMEOUT)
+    return cost
+
+
+class QueryCostMixin:
+    """
+    Rejects list requests whose filters and ordering would make Postgres
+    scan or sort a large table.
+
+    Requests that only order by indexed_fields, and only filter them with
+    INDEXED_LOOKUPS, are let through as is. The others are checked with
+    EXPLAIN, limited to the requested page, and rejected with a 400
+    response when the planner's cost is over TOWER_GUARDRAILS['MAX_COST'].
+    """
+    indexed_fields = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and not self.is_export():
+            self.check_query_cost(queryset)
+        return queryset
+
+    def is_export(self):
+        get_stream_format = getattr(self, 'get_stream_format', None)
+        return bool(get_stream_format and get_stream_format())
+
+    def check_query_cost(self, queryset):
+        max_cost = settings.TOWER_GUARDRAILS['MAX_COST']
+        if not max_cost:
+            return
+        indexed = set(self.indexed_fields)
+        indexed.update(('pk', queryset.model._meta.pk.name))
+        if all(field in indexed and lookup in INDEXED_LOOKUPS
+               for field, lookup in get_query_fields(queryset)):
+            return
+        if get_query_cost(self.get_page_queryset(queryset)) > max_cost:
+            raise QueryTooExpensive(
+                '%s Indexed fields: %s.' % (
+                    QueryTooExpensive.default_detail,
+                    ', '.join(self.indexed_fields)))
+
+    def get_page_queryset(self, queryset):
+        """
+        Limits the queryset to the requested page, so ordering on an index
+        is priced by the rows it reads, not by the size of the table.
+        """
+        paginator = self.paginator
+        if paginator is None or not hasattr(paginator, 'get_limit'):
+            return queryset
+        limit = paginator.get_limit(self.request) or paginator.default_limit
+        offset = 0
+        is_keyset = getattr(paginator, 'is_keyset', None)
+        if not (is_keyset and is_keyset(self.request)):
+            offset = paginator.get_offset(self.request)
+        return queryset[offset:offset + limit]
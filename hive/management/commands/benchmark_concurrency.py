@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from itertools import cycle
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = (
+    '/api/v1/state/',
+    '/api/v1/accounts/?limit=20',
+    '/api/v1/blocks/?limit=20',
+    '/api/v1/post_cache/?limit=5',
+)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Sends requests from --clients concurrent connections to a " \
+           "running Tower for --duration seconds, while --waiters " \
+           "connections long-poll for new blocks, and reports the " \
+           "throughput and latency. Run it against the threaded " \
+           "(docker/uwsgi.ini) and gevent (docker/uwsgi-gevent.ini) " \
+           "servers to compare them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--path', action='append', dest='paths')
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--waiters', type=int, default=0)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        paths = options['paths'] or DEFAULT_PATHS
+        deadline = time.monotonic() + options['duration']
+        timeout = options['timeout']
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def client(paths):
+            for path in cycle(paths):
+                if time.monotonic() >= deadline:
+                    return
+                start = time.perf_counter()
+                try:
+                    with urlopen(base_url + path, timeout=timeout) as response:
+                        response.read()
+                except (URLError, OSError):
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        def waiter():
+            # keeps a long-poll connection open for the whole run
+            after_block = ''
+            while time.monotonic() < deadline:
+                try:
+                    with urlopen(
+                            '%s/api/v1/state/blocks/?after_block=%s' % (
+                                base_url, after_block),
+                            timeout=timeout) as response:
+                        blocks = json.loads(response.read().decode('utf-8'))
+                except (URLError, OSError, ValueError):
+                    time.sleep(1)
+                    continue
+                if blocks:
+                    after_block = blocks[-1]['num']
+
+        threads = [threading.Thread(target=waiter, daemon=True)
+                   for _ in range(options['waiters'])]
+        threads += [
+            threading.Thread(
+                target=client, args=(paths[i % len(paths):] +
+                                     paths[:i % len(paths)],))
+            for i in range(options['clients'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads[options['waiters']:]:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write("clients %s, waiters %s, %.1fs" % (
+            options['clients'], options['waiters'], elapsed))
+        self.stdout.write("requests %s, errors %s, %.1f req/s" % (
+            len(latencies), errors[0], len(latencies) / elapsed))
+        self.stdout.write("latency p50 %.1fms, p95 %.1fms, p99 %.1fms" % tuple(
+            percentile(latencies, fraction) * 1000
+            for fraction in (0.5, 0.95, 0.99)))
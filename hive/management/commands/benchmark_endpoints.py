@@ -0,0 +1,321 @@
+import json
+import random
+import time
+from contextlib import ExitStack
+
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils.http import urlencode
+
+from hive.cache import get_cache, get_head_block
+from hive.models import Account, Block, Community, PostCache, PostTag
+from hive.rankings import snapshots
+from hive.votes import vote_cache
+
+from .benchmark_concurrency import percentile
+
+POOL_SIZE = 5000
+
+# Endpoints that are not benchmarked: the admin and the API docs, and the
+# server-sent events stream, which never finishes on its own.
+SKIPPED = ('docs-index', 'schema-js', 'state-stream')
+
+LIMITS = (10, 20, 20, 20, 50, 100)
+
+# --cold empties the whole response cache, which is only safe when it
+# lives in this process.
+LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class Sample:
+    """
+    Picks the parameters of the requests from the dataset. Like on the
+    chain, a few accounts, posts and tags get most of the traffic.
+    """
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.accounts = list(Account.objects.order_by(
+            '-followers', 'id').values_list('name', flat=True)[:POOL_SIZE])
+        self.posts = list(PostCache.objects.order_by(
+            '-total_votes', 'post_id').values_list(
+            'author', 'permlink')[:POOL_SIZE])
+        self.tags = list(PostTag.objects.values('tag').annotate(
+            posts=Count('post')).order_by('-posts', 'tag').values_list(
+            'tag', flat=True)[:POOL_SIZE])
+        self.communities = list(Community.objects.order_by(
+            'created_at').values_list('name', flat=True)[:POOL_SIZE])
+        self.head_block = get_head_block() or Block.objects.count()
+        if not (self.accounts and self.posts and self.head_block):
+            raise CommandError(
+                "The database has no accounts, posts or blocks, fill it "
+                "with generate_dataset first.")
+
+    def pick(self, pool):
+        """Returns an item of the pool, the first ones most of the time."""
+        return pool[int(len(pool) * self.random.random() ** 3)] if pool \
+            else ''
+
+    def choice(self, values):
+        return self.random.choice(values)
+
+    def account(self):
+        return {'name': self.pick(self.accounts)}
+
+    def post(self):
+        author, permlink = self.pick(self.posts)
+        return {'author': author, 'permlink': permlink}
+
+    def community(self):
+        return {'name': self.pick(self.communities)}
+
+    def block(self):
+        # recent blocks are requested far more than old ones
+        return max(1, self.head_block - int(
+            self.head_block * self.random.random() ** 8))
+
+    def limit(self):
+        return self.choice(LIMITS)
+
+
+def accounts_list(sample):
+    return sample.choice((
+        {'limit': sample.limit()},
+        {'limit': sample.limit(),
+         'ordering': sample.choice(('-followers', '-reputation', 'name'))},
+        {'min_followers': sample.choice((10, 50, 100)),
+         'ordering': '-followers'},
+        {'name__startswith': sample.pick(sample.accounts)[:5]},
+        {'names': ",".join(sample.pick(sample.accounts)
+                           for _ in range(sample.choice((5, 20, 50))))},
+    ))
+
+
+def post_cache_list(sample):
+    return sample.choice((
+        {'limit': sample.limit()},
+        {'author': sample.pick(sample.accounts), 'limit': sample.limit()},
+        {'limit': sample.limit(),
+         'ordering': sample.choice(('-created_at', '-payout', '-post_id'))},
+        {'limit': sample.limit(), 'fields': 'post,author,permlink,title'},
+    ))
+
+
+def ranking(sample):
+    return sample.choice((
+        {'limit': sample.limit()},
+        {'limit': sample.limit(), 'tag': sample.pick(sample.tags)},
+        {'limit': sample.limit(),
+         'community': sample.pick(sample.communities)},
+    ))
+
+
+def block_range(sample):
+    to_num = sample.block()
+    return {'from_num': max(1, to_num - sample.choice((0, 10, 100))),
+            'to_num': to_num}
+
+
+# url name: (path kwargs, query parameters), given a Sample.
+SCENARIOS = {
+    'api-root': lambda s: ({}, {}),
+    'metrics': lambda s: ({}, {}),
+    'state': lambda s: ({}, {}),
+    'state-blocks': lambda s: ({}, {
+        'after_block': s.head_block - s.choice((1, 5, 20)), 'timeout': 0}),
+    'accounts-list': lambda s: ({}, accounts_list(s)),
+    'accounts-detail': lambda s: (s.account(), {}),
+    'accounts-feed': lambda s: (s.account(), {'limit': s.limit()}),
+    'accounts-followers': lambda s: (s.account(), {'limit': s.limit()}),
+    'accounts-following': lambda s: (s.account(), {'limit': s.limit()}),
+    'accounts-muters': lambda s: (s.account(), {}),
+    'accounts-muting': lambda s: (s.account(), {}),
+    'accounts-payments': lambda s: (s.account(), s.choice((
+        {}, {'direction': 'sent'}, {'direction': 'received'}))),
+    'accounts-payment-totals': lambda s: (s.account(), s.choice((
+        {}, {'group': 'day'}))),
+    'accounts-reblogs': lambda s: (s.account(), {}),
+    'blocks-list': lambda s: ({}, {'limit': s.limit()}),
+    'blocks-detail': lambda s: ({'pk': s.block()}, {}),
+    'blocks-block-contents': lambda s: ({'pk': s.block()}, {}),
+    'blocks-contents': lambda s: ({}, block_range(s)),
+    'communities-list': lambda s: ({}, s.choice((
+        {}, {'ordering': '-created_at'}, {'lang': 'en'}))),
+    'communities-detail': lambda s: (s.community(), {}),
+    'communities-members': lambda s: (s.community(), {}),
+    'communities-modlog': lambda s: (s.community(), {}),
+    'post-cache-list': lambda s: ({}, post_cache_list(s)),
+    'post-cache-detail': lambda s: (s.post(), {}),
+    'posts-list': lambda s: ({}, post_cache_list(s)),
+    'posts-detail': lambda s: (s.post(), {}),
+    'post-cache-detail-filter-by-tags': lambda s: ({}, s.choice((
+        {'[]exact': s.pick(s.tags)},
+        {'[]exact': [s.pick(s.tags), s.pick(s.tags)]},
+        {'[]any': [s.pick(s.tags), s.pick(s.tags)],
+         '[]none': s.pick(s.tags)},
+    ))),
+    'post-cache-created': lambda s: ({}, ranking(s)),
+    'post-cache-hot': lambda s: ({}, ranking(s)),
+    'post-cache-payout': lambda s: ({}, ranking(s)),
+    'post-cache-promoted': lambda s: ({}, ranking(s)),
+    'post-cache-trending': lambda s: ({}, ranking(s)),
+    'post-cache-search': lambda s: ({}, {
+        'q': " ".join(s.pick(s.tags) for _ in range(s.choice((1, 1, 2))))}),
+    'post-cache-detail-reblogs': lambda s: (s.post(), {}),
+    'post-cache-detail-payments': lambda s: (s.post(), {}),
+    'post-cache-detail-replies': lambda s: (s.post(), s.choice((
+        {}, {'ordering': 'votes'}, {'depth': 2}))),
+    'post-cache-detail-votes': lambda s: (s.post(), s.choice((
+        {}, {'ordering': '-rshares'}))),
+}
+
+# POST endpoints, with their JSON body
+BODIES = {
+    'post-cache-batch': lambda s: {'posts': [
+        dict(zip(('author', 'permlink'), s.pick(s.posts)))
+        for _ in range(s.choice((5, 20, 50)))]},
+}
+
+
+def get_url_names(resolver=None):
+    """Returns the names of the url patterns, the admin left out."""
+    names = set()
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.name:
+                names.add(pattern.name)
+        elif getattr(pattern, 'app_name', None) != 'admin':
+            names |= get_url_names(pattern)
+    return names
+
+
+class Command(BaseCommand):
+    help = "Sends --requests requests to every endpoint, in process, with " \
+           "parameters picked from the database (see generate_dataset), " \
+           "and reports their latency, throughput and query counts. " \
+           "--output saves the results and --baseline compares them with " \
+           "a previous run, e.g. of the previous release."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help="Empty the caches before every request (needs the "
+                 "in-process cache backend).")
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help="Only benchmark the given url name(s).")
+        parser.add_argument('--output', help="Write the results as JSON.")
+        parser.add_argument('--baseline', help="Results of a previous run.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests has to be at least 1.")
+        if options['cold'] and not isinstance(get_cache(), LOCAL_CACHES):
+            raise CommandError(
+                "--cold would empty the shared %s cache, run it with "
+                "CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache "
+                "instead." % type(get_cache()).__name__)
+        names = get_url_names() - set(SKIPPED)
+        uncovered = names - set(SCENARIOS) - set(BODIES)
+        if uncovered:
+            self.stderr.write("No scenario for: %s" % ", ".join(
+                sorted(uncovered)))
+        names = sorted(names - uncovered)
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(names)
+            if unknown:
+                raise CommandError("Unknown endpoints: %s" % ", ".join(
+                    sorted(unknown)))
+            names = [name for name in names if name in options['endpoints']]
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['endpoints']
+
+        sample = Sample(options['seed'])
+        client = Client()
+        results = {}
+        self.stdout.write("%-34s %6s %6s %8s %8s %8s %8s %7s %8s" % (
+            'endpoint', 'reqs', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+            'req/s', 'queries', 'p95 diff'))
+        for name in names:
+            result = self.run(client, sample, name, options)
+            results[name] = result
+            previous = baseline.get(name)
+            diff = "%+7.0f%%" % (
+                (result['p95'] / previous['p95'] - 1) * 100) \
+                if previous and previous['p95'] else ""
+            self.stdout.write(
+                "%-34s %6d %6d %8.1f %8.1f %8.1f %8.1f %7.1f %8s" % (
+                    name, result['requests'], result['errors'],
+                    result['p50'], result['p95'], result['p99'],
+                    result['throughput'], result['queries'], diff))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'seed': options['seed'],
+                    'cold': options['cold'],
+                    'requests': options['requests'],
+                    'dataset': {
+                        'accounts': Account.objects.count(),
+                        'posts': PostCache.objects.count(),
+                        'head_block': sample.head_block,
+                    },
+                    'endpoints': results,
+                }, f, indent=2, sort_keys=True)
+
+    def run(self, client, sample, name, options):
+        """
+        Requests the endpoint --requests times and returns the latency
+        percentiles (ms), the throughput (req/s) and the mean number of
+        queries per request.
+        """
+        latencies, queries, errors = [], [], 0
+        for _ in range(options['requests']):
+            if name in BODIES:
+                kwargs, params = {}, {}
+                body = json.dumps(BODIES[name](sample))
+            else:
+                kwargs, params = SCENARIOS[name](sample)
+            url = reverse(name, kwargs=kwargs)
+            if params:
+                url += '?' + urlencode(params, doseq=True)
+            if options['cold']:
+                get_cache().clear()
+                snapshots.clear()
+                vote_cache.clear()
+            with ExitStack() as stack:
+                captures = [
+                    stack.enter_context(CaptureQueriesContext(connection))
+                    for connection in connections.all()]
+                start = time.perf_counter()
+                if name in BODIES:
+                    response = client.post(
+                        url, body, content_type='application/json')
+                else:
+                    response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append(time.perf_counter() - start)
+            queries.append(sum(len(capture) for capture in captures))
+            if response.status_code >= 400:
+                errors += 1
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'p50': percentile(latencies, 0.5) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'throughput': len(latencies) / sum(latencies),
+            'queries': sum(queries) / len(queries),
+            'max_queries': max(queries),
+        }
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from hive.models import Account, PostCache
+from hive.search import search_posts
+
+
+class Command(BaseCommand):
+    help = "Compares the latency of the contains filters with the prefix " \
+           "and full-text searches. Run it before and after " \
+           "create_search_indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', default='steem')
+        parser.add_argument('--text', default='photography')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        account, text = options['account'], options['text']
+        limit, repeat = options['limit'], options['repeat']
+        benchmarks = (
+            ('account name', Account.objects.filter(
+                name__contains=account).order_by('name'),
+             Account.objects.filter(
+                 name__startswith=account).order_by('name')),
+            ('post text', PostCache.objects.filter(
+                Q(title__icontains=text) | Q(body__icontains=text)).order_by(
+                '-post_id'),
+             search_posts(text)),
+        )
+        self.stdout.write("%-14s %16s %16s" % (
+            'search', 'contains (ms)', 'indexed (ms)'))
+        for name, before, after in benchmarks:
+            self.stdout.write("%-14s %16.1f %16.1f" % (
+                name,
+                self.measure(before.values('pk')[:limit], repeat) * 1000,
+                self.measure(after.values('pk')[:limit], repeat) * 1000))
+
+    @staticmethod
+    def measure(queryset, repeat):
+        """Returns the best wall time of `repeat` runs of the query."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - start)
+        return min(timings)
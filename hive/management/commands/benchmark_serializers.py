@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from hive.models import Account, Block, PostCache
+from hive.renderers import TowerJSONRenderer
+from hive.serializers import (
+    AccountSerializer, BlockSerializer, PostCacheSerializer, ValuesSerializer
+)
+
+
+class Command(BaseCommand):
+    help = "Compares the rows/sec of the ModelSerializer + JSONRenderer " \
+           "path with the values serializer + TowerJSONRenderer path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        benchmarks = (
+            ('accounts', Account.objects.all(), AccountSerializer),
+            ('blocks', Block.objects.all(), BlockSerializer),
+            ('post_cache', PostCache.objects.select_related('post'),
+             PostCacheSerializer),
+        )
+        self.stdout.write("%-12s %8s %14s %14s %8s" % (
+            'endpoint', 'rows', 'before (r/s)', 'after (r/s)', 'speedup'))
+        for name, queryset, serializer_class in benchmarks:
+            queryset = queryset[:rows]
+
+            def before():
+                data = serializer_class(queryset.all(), many=True).data
+                return JSONRenderer().render(data)
+
+            def after():
+                serializer = ValuesSerializer(serializer_class())
+                data = serializer.to_representation_many(
+                    queryset.values(*serializer.lookups))
+                return TowerJSONRenderer().render(data)
+
+            count = len(queryset)
+            if not count:
+                self.stdout.write("%-12s %8s" % (name, 0))
+                continue
+            before_rate = count / self.measure(before, repeat)
+            after_rate = count / self.measure(after, repeat)
+            self.stdout.write("%-12s %8d %14.0f %14.0f %7.1fx" % (
+                name, count, before_rate, after_rate,
+                after_rate / before_rate))
+
+    @staticmethod
+    def measure(func, repeat):
+        """Returns the best wall time of `repeat` runs, queries included."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from hive.search import SEARCH_INDEXES
+
+
+class Command(BaseCommand):
+    help = "Creates the trigram, prefix and full-text indexes used by the " \
+           "search endpoints. Hivemind owns the schema, so they are opt-in."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drop', action='store_true',
+            help="Drop the indexes instead of creating them.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Print the statements without running them.")
+        parser.add_argument(
+            '--timeout', type=int, default=0,
+            help="Statement timeout of the index builds in milliseconds, "
+                 "0 (the default) for none.")
+
+    def handle(self, *args, **options):
+        # builds on hivemind sized tables take far longer than the API's
+        # statement timeout, and a cancelled build leaves an invalid index
+        self.execute_sql(
+            "SET statement_timeout = %d" % options['timeout'], options)
+        if options['drop']:
+            for name, _ in SEARCH_INDEXES:
+                self.execute_sql(
+                    "DROP INDEX CONCURRENTLY IF EXISTS %s" % name, options)
+            return
+
+        invalid = self.get_invalid_indexes()
+        trigrams = True
+        try:
+            self.execute_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm", options)
+        except DatabaseError as e:
+            self.stderr.write(
+                "Skipping the trigram indexes, pg_trgm is not available: %s"
+                % str(e).splitlines()[0])
+            trigrams = False
+        for name, sql in SEARCH_INDEXES:
+            if 'gin_trgm_ops' in sql and not trigrams:
+                continue
+            if name in invalid:
+                # IF NOT EXISTS would keep the unusable index
+                self.stderr.write("Rebuilding the invalid index %s" % name)
+                self.execute_sql(
+                    "DROP INDEX CONCURRENTLY IF EXISTS %s" % name, options)
+            self.execute_sql(sql, options)
+
+    @staticmethod
+    def get_invalid_indexes():
+        """
+        Returns the names of the search indexes left invalid by an
+        interrupted CREATE INDEX CONCURRENTLY.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = ANY(%s) AND NOT i.indisvalid",
+                [[name for name, _ in SEARCH_INDEXES]])
+            return {row[0] for row in cursor.fetchall()}
+
+    def execute_sql(self, sql, options):
+        self.stdout.write(sql)
+        if options['dry_run']:
+            return
+        # CONCURRENTLY can't run in a transaction, the connection is in
+        # autocommit mode here.
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
@@ -0,0 +1,358 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from hive.models import (
+    Account, Block, Community, FeedCache, Follow, Member, Modlog, Payment,
+    Post, PostCache, PostTag, Reblog, State
+)
+
+BLOCK_INTERVAL = 3
+
+# The chain ends here unless --end says otherwise, so that the same
+# options give the same rows whenever they are generated.
+END = '2019-01-01T00:00:00'
+
+TAGS = (
+    'life', 'photography', 'steem', 'travel', 'art', 'busy', 'bitcoin',
+    'news', 'food', 'music', 'blog', 'crypto', 'cryptocurrency', 'nature',
+    'story', 'introduceyourself', 'health', 'science', 'poetry', 'sports',
+    'funny', 'technology', 'writing', 'money', 'utopian-io', 'dtube',
+    'steemit', 'kr', 'spanish', 'dlive',
+)
+
+# Popular accounts, communities, tags and posts get most of the activity:
+# picking floor(n * random() ^ SKEW) favours the first ones.
+SKEW = 3
+
+# Statements run in order, with the options as named parameters. The
+# posts are inserted flat, then their depth and category are derived
+# from their thread with a recursive update.
+#
+# The rows come out of random() in the order they are scanned, so it is
+# only called over a series or a table in insertion order. The thread
+# update rewrites hive_posts in plan order, and joins return rows in plan
+# order too: the statements reading posts take their draws from a series
+# of post ids instead, which always returns the same values.
+STATEMENTS = (
+    ("seed", "SELECT setseed(%(seed)s)"),
+    ("accounts", """
+INSERT INTO hive_accounts (
+    id, name, created_at, reputation, display_name, about, location,
+    website, profile_image, cover_image, followers, following, proxy,
+    post_count, proxy_weight, vote_weight, kb_used, rank, active_at,
+    cached_at, raw_json)
+SELECT i, 'user' || i,
+       %(start)s - (%(accounts)s - i) * interval '5 minutes',
+       CASE WHEN random() < 0.02 THEN -1 ELSE 1 END
+           * floor(10 ^ (9 + 5 * random() ^ 2)),
+       NULL, NULL,
+       CASE WHEN random() < 0.3 THEN (%(locations)s::text[])[
+           1 + floor(random() * 5)::int] END,
+       NULL, '', '', 0, 0, '', 0, 0, floor(10 ^ (6 + 6 * random() ^ 3)),
+       0, i, %(end)s, %(end)s, NULL
+FROM generate_series(1, %(accounts)s) i
+"""),
+    ("blocks", """
+INSERT INTO hive_blocks (num, hash, prev, txs, ops, created_at)
+SELECT i, md5(i::text), NULLIF(i - 1, 0), floor(random() * 40)::int,
+       floor(random() * 120)::int, %(start)s + i * %(interval)s
+FROM generate_series(1, %(blocks)s) i
+"""),
+    ("state", """
+INSERT INTO hive_state (
+    block_num, db_version, steem_per_mvest, usd_per_steem, sbd_per_steem,
+    dgpo)
+VALUES (%(blocks)s, 1, 495.000, 0.350, 1.000, '{}')
+"""),
+    ("communities", """
+INSERT INTO hive_communities (
+    name, title, about, description, lang, settings, type_id, is_nsfw,
+    created_at)
+SELECT 'user' || i, 'Community ' || i, 'About community ' || i, '', 'en',
+       '{}', 1 + i %% 3, random() < 0.05, %(start)s - i * interval '1 day'
+FROM generate_series(1, %(communities)s) i
+"""),
+    ("posts", """
+INSERT INTO hive_posts (
+    id, parent_id, author, permlink, community, category, depth,
+    created_at, is_deleted, is_pinned, is_muted, is_valid, promoted)
+SELECT i, parent_id, 'user' || (1 + floor(
+           %(accounts)s * random() ^ %(skew)s)::int),
+       CASE WHEN parent_id IS NULL THEN 'post-' ELSE 're-' END || i,
+       CASE WHEN random() < 0.2 THEN 'user' || (1 + floor(
+           %(communities)s * random() ^ %(skew)s)::int) ELSE '' END,
+       (%(tags)s::text[])[1 + floor(
+           %(tag_count)s * random() ^ %(skew)s)::int],
+       0, %(start)s + (1 + floor((i - 1) * %(blocks)s::float
+           / %(posts)s)) * %(interval)s,
+       random() < 0.01, false, random() < 0.005, true,
+       CASE WHEN random() < 0.03 THEN round((random() * 20)::numeric, 3)
+            ELSE 0 END
+FROM (
+    SELECT i, CASE WHEN i > 1 AND random() < %(reply_ratio)s
+                   THEN i - 1 - floor(random() ^ %(skew)s
+                                      * least(i - 1, 5000))::int END
+           AS parent_id
+    FROM generate_series(1, %(posts)s) i
+) posts
+"""),
+    ("threads", """
+WITH RECURSIVE thread (id, depth, category, community) AS (
+    SELECT id, 0, category, community FROM hive_posts
+    WHERE parent_id IS NULL
+  UNION ALL
+    SELECT reply.id, thread.depth + 1, thread.category, thread.community
+    FROM hive_posts reply JOIN thread ON reply.parent_id = thread.id
+)
+UPDATE hive_posts SET depth = thread.depth, category = thread.category,
+                      community = thread.community
+FROM thread WHERE hive_posts.id = thread.id
+"""),
+    # the next statements join the new rows, plan them with statistics
+    ("statistics", "ANALYZE hive_accounts, hive_posts"),
+    ("post tags", """
+WITH draw AS (
+    SELECT 1 + (i - 1) / 3 AS id, random() AS tag, random() AS pick
+    FROM generate_series(1, 3 * %(posts)s) i
+)
+INSERT INTO hive_post_tags (post_id, tag)
+SELECT id, category FROM hive_posts WHERE depth = 0
+UNION
+SELECT post.id, (%(tags)s::text[])[1 + floor(
+           %(tag_count)s * draw.tag ^ %(skew)s)::int]
+FROM draw JOIN hive_posts post ON post.id = draw.id
+WHERE post.depth = 0 AND draw.pick < 0.5
+ORDER BY 1, 2
+"""),
+    ("posts cache", """
+WITH draw AS (
+    SELECT i AS id, random() AS payout, random() AS nsfw,
+           random() AS rshares, random() AS sc_trend, random() AS sc_hot,
+           random() AS body, random() AS votes
+    FROM generate_series(1, %(posts)s) i
+)
+INSERT INTO hive_posts_cache (
+    post_id, author, permlink, category, depth, children, author_rep,
+    flag_weight, total_votes, up_votes, title, preview, img_url, payout,
+    promoted, created_at, payout_at, updated_at, is_paidout, is_nsfw,
+    is_declined, is_full_power, is_hidden, is_grayed, rshares, sc_trend,
+    sc_hot, body, votes, json, raw_json)
+SELECT post.id, post.author, post.permlink, post.category, post.depth,
+       coalesce(replies.count, 0), account.reputation, 0, votes.count,
+       votes.count, 'Title of post ' || post.id, left(body.text, 200), '',
+       CASE WHEN post.created_at + interval '7 days' > %(end)s
+            THEN round((votes.count * draw.payout * 0.5)::numeric, 3)
+            ELSE 0 END,
+       post.promoted, post.created_at, post.created_at + interval '7 days',
+       post.created_at, post.created_at + interval '7 days' <= %(end)s,
+       draw.nsfw < 0.01, false, false, false, false,
+       votes.count * floor(draw.rshares * 1000000000),
+       draw.sc_trend * 1000, draw.sc_hot * 1000, body.text, votes.blob,
+       '{"tags": ["' || post.category || '"]}', '{}'
+FROM hive_posts post
+JOIN draw ON draw.id = post.id
+JOIN hive_accounts account ON account.name = post.author
+LEFT JOIN (
+    SELECT parent_id, count(*) FROM hive_posts
+    WHERE parent_id IS NOT NULL GROUP BY parent_id
+) replies ON replies.parent_id = post.id
+CROSS JOIN LATERAL (
+    SELECT repeat(md5(post.id::text) || ' lorem ipsum dolor sit amet ',
+                  1 + floor(draw.body ^ 2 * 150)::int) AS text
+) body
+CROSS JOIN LATERAL (
+    SELECT count(*) AS count, coalesce(string_agg(
+        'user' || (1 + (post.id * 7919 + n * 104729) %% %(accounts)s)
+        || ',' || (1000000 * n) || ',10000,25', E'\\n'), '') AS blob
+    FROM generate_series(1, floor(
+        draw.votes ^ %(skew)s * %(max_votes)s)::int) n
+) votes
+"""),
+    ("follows", """
+INSERT INTO hive_follows (follower, following, state, created_at)
+SELECT account.id, 1 + floor(%(accounts)s * random() ^ %(skew)s)::int,
+       CASE WHEN random() < 0.03 THEN 2 ELSE 1 END,
+       %(start)s - random() * interval '365 days'
+FROM hive_accounts account
+-- the reference to account makes Postgres draw a count per account
+CROSS JOIN LATERAL generate_series(1, floor(
+    random() * 2 * %(follows)s + account.id * 0)::int) n
+ON CONFLICT DO NOTHING
+"""),
+    ("reblogs", """
+WITH draw AS (
+    SELECT i AS id, random() AS account, random() AS delay, random() AS pick
+    FROM generate_series(1, %(posts)s) i
+)
+INSERT INTO hive_reblogs (account, post_id, created_at)
+SELECT 'user' || (1 + floor(%(accounts)s * draw.account)::int), post.id,
+       post.created_at + draw.delay * interval '1 day'
+FROM draw JOIN hive_posts post ON post.id = draw.id
+WHERE post.depth = 0 AND draw.pick < 0.1
+ON CONFLICT DO NOTHING
+"""),
+    ("feed cache", """
+INSERT INTO hive_feed_cache (post_id, account_id, created_at)
+SELECT post.id, account.id, post.created_at
+FROM hive_posts post JOIN hive_accounts account ON account.name = post.author
+WHERE post.depth = 0
+UNION
+SELECT reblog.post_id, account.id, reblog.created_at
+FROM hive_reblogs reblog
+JOIN hive_accounts account ON account.name = reblog.account
+ORDER BY 1, 2
+ON CONFLICT DO NOTHING
+"""),
+    ("members", """
+INSERT INTO hive_members (
+    community, account, is_admin, is_mod, is_approved, is_muted, title)
+SELECT 'user' || c, 'user' || (1 + floor(%(accounts)s * random())::int),
+       n = 1, n <= 3, true, random() < 0.01, ''
+-- the c-th community has a c-th of the members of the first one
+FROM generate_series(1, %(communities)s) c
+CROSS JOIN LATERAL generate_series(
+    1, 1 + floor(%(accounts)s * 0.2 / c)::int) n
+ON CONFLICT DO NOTHING
+"""),
+    ("modlog", """
+INSERT INTO hive_modlog (community, account, action, params, created_at)
+SELECT member.community, member.account,
+       (ARRAY['mutePost', 'unmutePost', 'pinPost', 'setUserTitle'])[
+           1 + floor(random() * 4)::int], '{}',
+       %(end)s - random() * (%(end)s - %(start)s)
+FROM hive_members member, generate_series(1, 10)
+WHERE member.is_mod
+"""),
+    ("payments", """
+WITH draw AS (
+    SELECT i AS id, random() AS tx_idx, random() AS sender,
+           random() AS receiver, random() AS amount, random() AS token,
+           random() AS pick
+    FROM generate_series(1, %(posts)s) i
+)
+INSERT INTO hive_payments (
+    block_num, tx_idx, post_id, from_account, to_account, amount, token)
+SELECT 1 + floor(extract(epoch FROM post.created_at - %(start)s)
+                 / %(block_interval)s)::int,
+       floor(draw.tx_idx * 40)::int, post.id,
+       1 + floor(%(accounts)s * draw.sender ^ %(skew)s)::int,
+       1 + floor(%(accounts)s * draw.receiver)::int,
+       round((0.001 + draw.amount ^ %(skew)s * 50)::numeric, 3),
+       CASE WHEN draw.token < 0.8 THEN 'SBD' ELSE 'STEEM' END
+FROM draw JOIN hive_posts post ON post.id = draw.id
+WHERE post.depth = 0 AND draw.pick < 0.05
+"""),
+    ("account counters", """
+UPDATE hive_accounts SET followers = coalesce(followers.count, 0),
+                         following = coalesce(following.count, 0),
+                         post_count = coalesce(posts.count, 0)
+FROM hive_accounts account
+LEFT JOIN (SELECT following AS id, count(*) FROM hive_follows
+           WHERE state = 1 GROUP BY following) followers USING (id)
+LEFT JOIN (SELECT follower AS id, count(*) FROM hive_follows
+           WHERE state = 1 GROUP BY follower) following USING (id)
+LEFT JOIN (SELECT author AS name, count(*) FROM hive_posts
+           GROUP BY author) posts USING (name)
+WHERE hive_accounts.id = account.id
+"""),
+)
+
+MODELS = (
+    Account, Block, State, Community, Post, PostTag, PostCache, Follow,
+    Reblog, FeedCache, Member, Modlog, Payment,
+)
+
+
+class Command(BaseCommand):
+    help = "Fills a local Postgres database with a synthetic hivemind " \
+           "dataset (accounts, blocks, posts, communities, follows, " \
+           "reblogs, payments...) " \
+           "for load tests and benchmarks. The same options and seed give " \
+           "the same dataset. Never run it against a hivemind database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--accounts', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--communities', type=int, default=50)
+        parser.add_argument(
+            '--days', type=float, default=7,
+            help="Length of the chain, the posts are spread over it.")
+        parser.add_argument(
+            '--end', default=END,
+            help="Time of the last block, in ISO 8601 (UTC if naive).")
+        parser.add_argument('--reply-ratio', type=float, default=0.6)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help="Average number of accounts an account follows.")
+        parser.add_argument('--max-votes', type=int, default=300)
+        parser.add_argument('--seed', type=float, default=0.42)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help="Empty the tables (and the ones referencing them) first, "
+                 "if they already have rows.")
+
+    def handle(self, *args, **options):
+        if not -1 <= options['seed'] <= 1:
+            raise CommandError("--seed has to be between -1 and 1.")
+        end = parse_datetime(options['end'])
+        if end is None:
+            raise CommandError("--end has to be a date and time in ISO 8601.")
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end, timezone.utc)
+        connection = connections[options['database']]
+        tables = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for model in MODELS:
+                if model._meta.db_table not in tables:
+                    editor.create_model(model)
+
+        with connection.cursor() as cursor:
+            # the inserts and the ANALYZE take minutes on big datasets
+            cursor.execute("SET statement_timeout = 0")
+            cursor.execute("SELECT count(*) FROM hive_accounts")
+            if cursor.fetchone()[0]:
+                if not options['flush']:
+                    raise CommandError(
+                        "The tables already have rows, pass --flush to "
+                        "replace them.")
+                cursor.execute(
+                    "TRUNCATE %s RESTART IDENTITY CASCADE" % ", ".join(
+                        model._meta.db_table for model in MODELS))
+
+        blocks = int(options['days'] * 24 * 3600 / BLOCK_INTERVAL)
+        interval = timedelta(seconds=BLOCK_INTERVAL)
+        params = {
+            'seed': options['seed'],
+            'accounts': options['accounts'],
+            'posts': options['posts'],
+            'communities': options['communities'],
+            'blocks': blocks,
+            'reply_ratio': options['reply_ratio'],
+            'follows': options['follows'],
+            'max_votes': options['max_votes'],
+            'skew': SKEW,
+            'tags': list(TAGS),
+            'tag_count': len(TAGS),
+            'locations': ['istanbul', 'berlin', 'new york', 'seoul', 'lagos'],
+            'start': end - blocks * interval,
+            'end': end,
+            'interval': interval,
+            'block_interval': BLOCK_INTERVAL,
+        }
+        with transaction.atomic(using=options['database']):
+            with connection.cursor() as cursor:
+                for name, sql in STATEMENTS:
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    self.stdout.write("%-16s %9s rows %8.1fs" % (
+                        name, max(cursor.rowcount, 0),
+                        time.perf_counter() - started))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE %s" % ", ".join(
+                model._meta.db_table for model in MODELS))
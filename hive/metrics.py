@@ -0,0 +1,293 @@
+import cProfile
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Registries of the processes that exited are summed into this file, so
+# that their counters aren't lost and recycled workers don't leave a file
+# behind each.
+ARCHIVE_FILENAME = 'exited.json'
+
+_local = threading.local()
+
+
+class Registry:
+    """
+    Counters and histograms of the current process.
+
+    Every process writes its registry to a file in TOWER_METRICS['DIR'] at
+    most every FLUSH_INTERVAL seconds, and the /metrics view sums the
+    files, so the numbers cover all the workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets), 'counts': [0] * len(buckets),
+                    'sum': 0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, histogram]
+                               for (name, labels), histogram
+                               in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and \
+                now - self.flushed_at < settings.TOWER_METRICS['FLUSH_INTERVAL']:
+            return
+        self.flushed_at = now
+        directory = settings.TOWER_METRICS['DIR']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '%s.json' % os.getpid())
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.dump(), f)
+        os.replace(path + '.tmp', path)
+
+
+registry = Registry()
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(counters, histograms, dump):
+    for name, labels, value in dump['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, histogram in dump['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, {
+            'buckets': histogram['buckets'],
+            'counts': [0] * len(histogram['buckets']),
+            'sum': 0, 'count': 0})
+        total['counts'] = [
+            a + b for a, b in zip(total['counts'], histogram['counts'])]
+        total['sum'] += histogram['sum']
+        total['count'] += histogram['count']
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(directory):
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def archive_exited(directory):
+    """
+    Moves the registries of the processes that are gone into
+    ARCHIVE_FILENAME. Callers hold the directory lock, so that a file
+    is neither archived twice nor read both before and after it is
+    archived.
+    """
+    exited = [
+        os.path.join(directory, filename)
+        for filename in sorted(os.listdir(directory))
+        if filename.endswith('.json') and filename[:-5].isdigit() and
+        not is_running(int(filename[:-5]))]
+    if not exited:
+        return
+    archive = Registry()
+    path = os.path.join(directory, ARCHIVE_FILENAME)
+    for dump in map(_load, [path] + exited):
+        if dump:
+            _add(archive.counters, archive.histograms, dump)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(archive.dump(), f)
+    os.replace(path + '.tmp', path)
+    for filename in exited:
+        os.remove(filename)
+
+
+def collect():
+    """
+    Returns the sum of the registries written by all the processes.
+    """
+    counters, histograms = {}, {}
+    directory = settings.TOWER_METRICS['DIR']
+    with _locked(directory):
+        archive_exited(directory)
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            dump = _load(os.path.join(directory, filename))
+            if dump:
+                _add(counters, histograms, dump)
+    return counters, histograms
+
+
+def _format_labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels)
+
+
+def render_metrics(counters, histograms):
+    """
+    Renders the metrics in the Prometheus text exposition format.
+    """
+    lines, typed = [], set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append('# TYPE %s counter' % name)
+            typed.add(name)
+        lines.append('%s%s %s' % (name, _format_labels(labels), value))
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name not in typed:
+            lines.append('# TYPE %s histogram' % name)
+            typed.add(name)
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            lines.append('%s_bucket%s %s' % (
+                name, _format_labels(labels, le=bound), count))
+        lines.append('%s_bucket%s %s' % (
+            name, _format_labels(labels, le='+Inf'), histogram['count']))
+        lines.append('%s_sum%s %s' % (
+            name, _format_labels(labels), histogram['sum']))
+        lines.append('%s_count%s %s' % (
+            name, _format_labels(labels), histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    registry.flush(force=True)
+    return HttpResponse(
+        render_metrics(*collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@contextmanager
+def timed(name):
+    """
+    Adds the time spent in the block to the current request's `name`
+    timing, e.g. with timed('serialize'): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0) + \
+                time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, query count, SQL time, serialization and
+    rendering time and the response size of every request, labelled by url
+    name. A sample of the requests (PROFILE_SAMPLE_RATE) is run under
+    cProfile, and the profiles of the ones slower than PROFILE_SLOW_SECONDS
+    are written to PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.TOWER_METRICS
+        _local.timings = timings = {'sql': 0}
+        queries = [0]
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timings['sql'] += time.perf_counter() - start
+                queries[0] += 1
+
+        profiler = None
+        if random.random() < config['PROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record_query))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        duration = time.perf_counter() - start
+        _local.timings = None
+
+        match = request.resolver_match
+        view = (match.url_name if match else None) or 'unmatched'
+        labels = {'view': view}
+        registry.inc('tower_requests_total', dict(
+            labels, method=request.method, status=response.status_code))
+        registry.observe('tower_request_duration_seconds', labels, duration)
+        registry.inc('tower_db_queries_total', labels, queries[0])
+        registry.inc('tower_db_query_seconds_total', labels, timings['sql'])
+        for name in ('serialize', 'render'):
+            if name in timings:
+                registry.inc(
+                    'tower_%s_seconds_total' % name, labels, timings[name])
+        if not response.streaming:
+            registry.inc(
+                'tower_response_bytes_total', labels, len(response.content))
+        registry.flush()
+
+        if profiler is not None and duration >= config['PROFILE_SLOW_SECONDS']:
+            os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+            profiler.dump_stats(os.path.join(
+                config['PROFILE_DIR'], '%s-%d-%s.prof' % (
+                    time.strftime('%Y%m%d%H%M%S'), os.getpid(), view)))
+        return response
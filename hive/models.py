@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 
 from .constants import FOLLOW_STATE_FOLLOWING, FOLLOW_STATE_MUTE
 
@@ -30,42 +31,37 @@ class Account(models.Model):
         db_table = 'hive_accounts'
         ordering = ['-pk']
 
+    def follows(self, state, incoming=True):
+        """
+        Returns the account's hive_follows rows in the given state as
+        ``{"name", "created_at"}`` dicts. The name of the account on the other
+        side is resolved with a single JOIN on hive_accounts.
+        """
+        if incoming:
+            lookup, other = 'following', 'follower'
+        else:
+            lookup, other = 'follower', 'following'
+        return Follow.objects.filter(**{lookup: self.id, 'state': state})\
+            .values('created_at', name=F('%s__name' % other))
+
     @property
     def follower_list(self):
-        follower_ids = Follow.objects.filter(
-            following=self.id, state=FOLLOW_STATE_FOLLOWING).values_list(
-            'follower', flat=True)
-        follower_names = Account.objects.filter(
-            id__in=follower_ids).values_list('name', flat=True)
-        return follower_names
+        return self.follows(FOLLOW_STATE_FOLLOWING).values_list(
+            'name', flat=True)
 
     @property
     def following_list(self):
-        following_ids = Follow.objects.filter(
-            follower=self.id, state=FOLLOW_STATE_FOLLOWING).values_list(
-            'following', flat=True)
-        following_names = Account.objects.filter(
-            id__in=following_ids).values_list('name', flat=True)
-        return following_names
+        return self.follows(FOLLOW_STATE_FOLLOWING, incoming=False)\
+            .values_list('name', flat=True)
 
     @property
     def muter_list(self):
-        muter_ids = Follow.objects.filter(
-            following=self.id, state=FOLLOW_STATE_MUTE).values_list(
-            'follower', flat=True)
-        muter_names = Account.objects.filter(
-            id__in=muter_ids).values_list('name', flat=True)
-        return muter_names
+        return self.follows(FOLLOW_STATE_MUTE).values_list('name', flat=True)
 
     @property
     def muted_list(self):
-        muted_ids = Follow.objects.filter(
-            follower=self.id, state=FOLLOW_STATE_MUTE).values_list(
-            'following', flat=True)
-        muted_names = Account.objects.filter(
-            id__in=muted_ids).values_list('name', flat=True)
-        return muted_names
-
+        return self.follows(FOLLOW_STATE_MUTE, incoming=False).values_list(
+            'name', flat=True)
 
 
 class Block(models.Model):
@@ -86,7 +82,7 @@ class Block(models.Model):
 
 class Community(models.Model):
     name = models.OneToOneField(Account, models.DO_NOTHING, db_column='name',
-                             primary_key=True)
+                                to_field='name', primary_key=True)
     title = models.CharField(max_length=32)
     about = models.CharField(max_length=255)
     description = models.CharField(max_length=5000)
@@ -102,14 +98,18 @@ class Community(models.Model):
 
 
 class FeedCache(models.Model):
-    post_id = models.IntegerField()
-    account_id = models.IntegerField()
+    post = models.ForeignKey(
+        'PostCache', models.DO_NOTHING, db_column='post_id',
+        related_name='feed_entries')
+    account = models.ForeignKey(
+        Account, models.DO_NOTHING, db_column='account_id',
+        related_name='feed_entries')
     created_at = models.DateTimeField()
 
     class Meta:
         managed = False
         db_table = 'hive_feed_cache'
-        unique_together = (('post_id', 'account_id'),)
+        unique_together = (('post', 'account'),)
 
 
 class Flag(models.Model):
@@ -125,8 +125,12 @@ class Flag(models.Model):
 
 
 class Follow(models.Model):
-    follower = models.IntegerField()
-    following = models.IntegerField()
+    follower = models.ForeignKey(Account, models.DO_NOTHING,
+                                 db_column='follower',
+                                 related_name="follower_acc")
+    following = models.ForeignKey(Account, models.DO_NOTHING,
+                                  db_column='following',
+                                  related_name="following_acc")
     state = models.SmallIntegerField()
     created_at = models.DateTimeField()
 
@@ -139,7 +143,8 @@ class Follow(models.Model):
 class Member(models.Model):
     community = models.ForeignKey(Community, models.DO_NOTHING,
                                   db_column='community')
-    account = models.ForeignKey(Account, models.DO_NOTHING, db_column='account')
+    account = models.ForeignKey(Account, models.DO_NOTHING, db_column='account',
+                                to_field='name')
     is_admin = models.BooleanField()
     is_mod = models.BooleanField()
     is_approved = models.BooleanField()
@@ -155,7 +160,8 @@ class Member(models.Model):
 class Modlog(models.Model):
     community = models.ForeignKey(Community, models.DO_NOTHING,
                                   db_column='community')
-    account = models.ForeignKey(Account, models.DO_NOTHING, db_column='account')
+    account = models.ForeignKey(Account, models.DO_NOTHING, db_column='account',
+                                to_field='name')
     action = models.CharField(max_length=32)
     params = models.CharField(max_length=1000)
     created_at = models.DateTimeField()
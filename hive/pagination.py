@@ -1,13 +1,420 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import (
+    EmptyResultSet, FieldDoesNotExist, ValidationError
+)
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.compat import coreapi, coreschema
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import get_cache, get_head_block
+
+
+class KeysetPaginationMixin:
+    """
+    Adds a keyset (cursor) mode to a limit/offset paginator.
+
+    The mode is enabled by passing the cursor parameter (an empty value
+    requests the first page). Pages are fetched with a WHERE clause on the
+    active ordering plus a unique key as a tiebreaker, so page N costs
+    the same as page 1 and no count is issued.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Opaque cursor to continue a keyset ' \
+                               'paginated listing. Pass it empty to start.'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_keyset(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_keyset(request) or not self.supports_keyset(queryset):
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            self.limit = self.default_limit
+        self.display_page_controls = False
+
+        self.ordering = self.get_keyset_ordering(queryset)
+        position, reverse = self.decode_cursor(request, queryset)
+        self.cursor_given = position is not None
+        self.reverse = reverse
+
+        fields = [field.lstrip('-') for field in self.ordering]
+        if getattr(queryset, '_fields', None):
+            missing = [f for f in fields if f not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*(queryset._fields + tuple(missing)))
+        else:
+            loaded, deferred = queryset.query.deferred_loading
+            if loaded and not deferred:
+                # keep the cursor fields out of the .only() projection's
+                # deferred set, they are read from every page's edges
+                queryset = queryset.only(*(set(loaded) | set(fields)))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._position_filter(ordering, position))
+
+        results = list(queryset[:self.limit + 1])
+        self.has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    @staticmethod
+    def supports_keyset(queryset):
+        """
+        Lists and aggregates (GROUP BY) are paginated with offsets: adding
+        the key to the values() of a grouped queryset would split its
+        groups into rows.
+        """
+        return isinstance(queryset, QuerySet) and \
+            queryset.query.group_by is None
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.page:
+            return None
+        if not self.reverse and not self.has_more:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.page:
+            return None
+        if self.reverse and not self.has_more:
+            return None
+        if not self.reverse and not self.cursor_given:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_keyset_ordering(self, queryset):
+        """
+        Returns the ordering of the queryset with a unique key appended as
+        a tiebreaker. Explicit order_by() calls (ordering filters, actions)
+        win over the model's Meta.ordering.
+
+        Hivemind tables like hive_reblogs have no id column, so their
+        unique_together fields are used as the key instead of the pk.
+        """
+        opts = queryset.model._meta
+        ordering = [
+            field for field in (queryset.query.order_by or opts.ordering)
+            if isinstance(field, str) and field != '?'
+        ]
+        if opts.unique_together:
+            key = [opts.get_field(name).attname
+                   for name in opts.unique_together[0]]
+        else:
+            key = [opts.pk.attname]
+
+        normalized = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.attname
+            else:
+                try:
+                    name = opts.get_field(name).attname
+                except FieldDoesNotExist:
+                    pass
+            normalized.append(('-' if field.startswith('-') else '') + name)
+
+        ordered = [field.lstrip('-') for field in normalized]
+        prefix = '-' if normalized and normalized[-1].startswith('-') else ''
+        for name in key:
+            if name not in ordered:
+                normalized.append(prefix + name)
+        return normalized
+
+    def encode_cursor(self, row, reverse):
+        position = [
+            self._get_value(row, field.lstrip('-')) for field in self.ordering]
+        payload = {'p': [None if v is None else str(v) for v in position]}
+        if reverse:
+            payload['r'] = 1
+        token = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.cursor_query_param, token.decode('ascii'))
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            raw_position = payload['p']
+            reverse = bool(payload.get('r'))
+            if len(raw_position) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._to_python(queryset.model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, raw_position)]
+        except (TypeError, ValueError, KeyError, AttributeError,
+                UnicodeError, ValidationError):
+            raise exceptions.ValidationError(
+                {self.cursor_query_param: self.invalid_cursor_message})
+        return position, reverse
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        if coreapi is None:
+            return fields
+        return fields + [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description=self.cursor_query_description
+                )
+            )
+        ]
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _position_filter(ordering, position):
+        """
+        Builds the lexicographic "comes after" condition for the given
+        ordering, e.g. (a < x) OR (a = x AND b < y) for ['-a', '-b'].
+
+        Postgres sorts NULLs after every value in ascending order (and so
+        before them in descending order), which the comparisons follow.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            null = Q(**{'%s__isnull' % name: True})
+            if value is None:
+                # only non-NULL values come after a NULL, in descending order
+                if descending:
+                    condition |= equal & ~null
+                equal &= null
+                continue
+            after = Q(**{'%s__%s' % (name, 'lt' if descending else 'gt'):
+                         value})
+            if not descending:
+                after |= null
+            condition |= equal & after
+            equal &= Q(**{name: value})
+        return condition
 
+    @staticmethod
+    def _get_value(row, field):
+        if isinstance(row, dict):
+            return row[field]
+        for part in field.split('__'):
+            row = getattr(row, part)
+        return row
 
-class TowerPagination(LimitOffsetPagination):
+    @staticmethod
+    def _to_python(model, field, value):
+        if value is None:
+            return None
+        parts = field.split('__')
+        try:
+            for part in parts[:-1]:
+                model = model._meta.get_field(part).related_model
+            model_field = model._meta.get_field(parts[-1])
+        except (AttributeError, FieldDoesNotExist):
+            return value
+        value = model_field.to_python(value)
+        # hivemind stores naive UTC timestamps
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.utc)
+        return value
+
+
+class EstimatedCountMixin:
+    """
+    Counts limit/offset listings without scanning large tables.
+
+    Results the planner expects to have estimate_threshold rows or more
+    are counted with the planner's estimate, smaller ones exactly. Counts
+    are cached until the head block changes and can be skipped with
+    ?count=false. The next link doesn't depend on the count, one extra
+    row is fetched instead.
+    """
+    count_query_param = 'count'
+    count_query_description = 'Pass false to leave out the total count.'
+    estimate_threshold = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+
+        self.count, self.count_estimated = None, False
+        if self.wants_count(request):
+            self.count, self.count_estimated = self.get_count(queryset)
+            if self.count > self.limit and self.template is not None:
+                self.display_page_controls = True
+            if not self.count_estimated and self.offset >= self.count:
+                self.has_more = False
+                return []
+
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_more = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_estimated', self.count_estimated),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        offset = self.offset + self.limit
+        return replace_query_param(url, self.offset_query_param, offset)
+
+    def wants_count(self, request):
+        value = request.query_params.get(self.count_query_param, '')
+        return value.lower() not in ('false', '0', 'no')
+
+    def get_count(self, queryset):
+        """
+        Returns a (count, estimated) tuple for the queryset.
+        """
+        if not isinstance(queryset, QuerySet):
+            return len(queryset), False
+        queryset = queryset.order_by()
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0, False
+
+        cache = get_cache()
+        block_num = get_head_block()
+        key = 'tower:count:%s:%s' % (block_num, hashlib.md5(
+            repr((queryset.db, sql, params)).encode('utf-8')).hexdigest())
+        cached = cache.get(key) if block_num is not None else None
+        if cached is not None:
+            return cached
+
+        estimate = self.estimate_count(queryset, sql, params)
+        if estimate >= self.estimate_threshold:
+            result = estimate, True
+        else:
+            result = queryset.count(), False
+        if block_num is not None:
+            cache.set(key, result, settings.TOWER_CACHE['TIMEOUT'])
+        return result
+
+    @staticmethod
+    def estimate_count(queryset, sql, params):
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_schema_fields(self, view):
+        fields = super().get_schema_fields(view)
+        if coreapi is None:
+            return fields
+        return fields + [
+            coreapi.Field(
+                name=self.count_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Count',
+                    description=self.count_query_description
+                )
+            )
+        ]
+
+
+class TowerPagination(KeysetPaginationMixin, EstimatedCountMixin,
+                      LimitOffsetPagination):
     default_limit = 20
     max_limit = 100
 
 
-class TowerLimitedPagination(LimitOffsetPagination):
+class TowerLimitedPagination(KeysetPaginationMixin, EstimatedCountMixin,
+                             LimitOffsetPagination):
     default_limit = 5
     max_limit = 10
 
 
+class TowerCursorPagination(KeysetPaginationMixin, LimitOffsetPagination):
+    """
+    Always paginates with a keyset cursor. Used by listings that never
+    exposed offsets, like the follower lists, and the ones that dropped
+    them, which reject ?offset= instead of returning the first page again.
+    """
+    default_limit = 20
+    max_limit = 100
+
+    def is_keyset(self, request):
+        return True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.offset_query_param in request.query_params:
+            raise exceptions.ValidationError({
+                self.offset_query_param: 'Offsets are not supported, follow '
+                                         'the next link (?%s=) instead.' %
+                                         self.cursor_query_param})
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_schema_fields(self, view):
+        return [field for field in super().get_schema_fields(view)
+                if field.name != self.offset_query_param]
+
+
+class TowerLimitedCursorPagination(TowerCursorPagination):
+    default_limit = 5
+    max_limit = 10
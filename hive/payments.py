@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.db.models import (
+    Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Coalesce, TruncDate
+
+from .models import Block, Payment
+
+# ?direction= of the account payment listings
+PAYMENT_DIRECTIONS = {
+    'sent': lambda account: Q(from_account=account),
+    'received': lambda account: Q(to_account=account),
+}
+
+
+def account_payments(account, direction=None):
+    """
+    Returns the payments sent and/or received by the account, newest
+    first.
+    """
+    if direction is None:
+        condition = Q(from_account=account) | Q(to_account=account)
+    else:
+        condition = PAYMENT_DIRECTIONS[direction](account)
+    return Payment.objects.filter(condition).order_by('-block_num', '-tx_idx')
+
+
+def _total(condition):
+    return Coalesce(Sum('amount', filter=condition), Value(Decimal(0)),
+                    output_field=DecimalField())
+
+
+def account_payment_totals(account, by_day=False):
+    """
+    Returns the amounts the account sent and received per token, and per
+    day with by_day, aggregated with a single GROUP BY query. Payments
+    have no timestamp, the day is the one of their block.
+    """
+    queryset = account_payments(account).order_by()
+    keys = ['token']
+    if by_day:
+        queryset = queryset.annotate(day=TruncDate(Subquery(
+            Block.objects.filter(num=OuterRef('block_num')).order_by().values(
+                'created_at')[:1])))
+        keys.insert(0, 'day')
+    return queryset.values(*keys).annotate(
+        sent=_total(Q(from_account=account)),
+        received=_total(Q(to_account=account)),
+        payments=Count('id'),
+    ).order_by(*('-' + key if key == 'day' else key for key in keys))
+
+
+def post_payment_totals(post_id):
+    """
+    Returns the promotion payments of the post per token.
+    """
+    return Payment.objects.filter(post_id=post_id).values('token').annotate(
+        amount=Sum('amount'),
+        payments=Count('id'),
+        accounts=Count('from_account', distinct=True),
+    ).order_by('token')
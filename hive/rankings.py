@@ -0,0 +1,47 @@
+from django.db.models import Q
+
+from .cache import LRUCache, get_head_block
+from .models import PostCache
+
+RANKING_SIZE = 1000
+SNAPSHOTS_CACHE_SIZE = 256
+
+# ordering and filter of each ranked list, after hivemind's own lists
+RANKINGS = {
+    'trending': (('-sc_trend', '-post_id'), Q(is_paidout=False, depth=0)),
+    'hot': (('-sc_hot', '-post_id'), Q(is_paidout=False, depth=0)),
+    'created': (('-created_at', '-post_id'), Q(depth=0)),
+    'promoted': (
+        ('-promoted', '-post_id'),
+        Q(is_paidout=False, depth=0, promoted__gt=0)),
+    'payout': (('-payout', '-post_id'), Q(is_paidout=False, depth=0)),
+}
+
+# query parameters that narrow a ranked list down
+RANKING_SCOPES = {
+    'tag': 'post__posttag__tag',
+    'category': 'category',
+    'community': 'post__community',
+}
+
+snapshots = LRUCache(SNAPSHOTS_CACHE_SIZE)
+
+
+def get_ranking(ranking, **scope):
+    """
+    Returns the ids of the top RANKING_SIZE posts of the ranked list.
+
+    The list is computed once per head block and scope, and kept in a
+    per-process LRU, so serving a page only costs fetching its rows.
+    """
+    block_num = get_head_block()
+    key = (ranking, tuple(sorted(scope.items())), block_num)
+    post_ids = snapshots.get(key)
+    if post_ids is None:
+        ordering, condition = RANKINGS[ranking]
+        queryset = PostCache.objects.filter(condition).filter(**{
+            RANKING_SCOPES[name]: value for name, value in scope.items()})
+        post_ids = tuple(queryset.order_by(*ordering).values_list(
+            'post_id', flat=True)[:RANKING_SIZE])
+        snapshots.set(key, post_ids)
+    return post_ids
@@ -0,0 +1,38 @@
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class TowerJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Types orjson doesn't handle natively (Decimal, lazy strings) and
+    datetimes are passed to DRF's JSONEncoder, so the output matches the
+    stock renderer. Falls back to the stock renderer when orjson is
+    missing or an indented response is requested.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # escape U+2028 and U+2029 like JSONRenderer does
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
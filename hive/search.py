@@ -0,0 +1,49 @@
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import PostCache
+
+SEARCH_CONFIG = 'english'
+
+# The search queries repeat this expression verbatim, otherwise Postgres
+# can't match them with the expression index.
+POST_DOCUMENT = (
+    "to_tsvector('%s'::regconfig, "
+    "coalesce(hive_posts_cache.title, '') || ' ' || "
+    "coalesce(hive_posts_cache.body, ''))" % SEARCH_CONFIG)
+
+POST_QUERY = "plainto_tsquery('%s'::regconfig, %%s)" % SEARCH_CONFIG
+
+# Indexes hivemind doesn't create, as (name, CREATE statement) pairs.
+SEARCH_INDEXES = (
+    ('tower_accounts_name_prefix',
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS tower_accounts_name_prefix "
+     "ON hive_accounts (name varchar_pattern_ops)"),
+    ('tower_accounts_name_trgm',
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS tower_accounts_name_trgm "
+     "ON hive_accounts USING gin (name gin_trgm_ops)"),
+    ('tower_accounts_location_trgm',
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS tower_accounts_location_trgm "
+     "ON hive_accounts USING gin (location gin_trgm_ops)"),
+    ('tower_posts_cache_document',
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS tower_posts_cache_document "
+     "ON hive_posts_cache USING gin ((%s))" % POST_DOCUMENT.replace(
+         'hive_posts_cache.', '')),
+)
+
+
+def search_posts(text, queryset=None):
+    """
+    Returns the posts whose title or body match the text, best matches
+    first. The match runs on the tower_posts_cache_document index when it
+    exists (see the create_search_indexes command).
+    """
+    if queryset is None:
+        queryset = PostCache.objects.all()
+    return queryset.extra(
+        where=["%s @@ %s" % (POST_DOCUMENT, POST_QUERY)], params=[text],
+    ).annotate(
+        search_rank=RawSQL(
+            "ts_rank(%s, %s)::float8" % (POST_DOCUMENT, POST_QUERY),
+            (text,), output_field=FloatField()),
+    ).order_by('-search_rank', '-post_id')
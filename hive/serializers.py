@@ -1,9 +1,170 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
 
-from .models import Account, Block, Post, PostCache, State
+from .communities import add_community_fields
+from .derived import add_account_fields, add_post_fields
+from .metrics import timed
+from .models import (
+    Account, Block, Community, FeedCache, Member, Modlog, Payment, Post,
+    PostCache, Reblog, State
+)
 
 
-class AccountSerializer(serializers.ModelSerializer):
+def get_related_paths(serializer, model=None, prefix=''):
+    """
+    Walks the fields of a serializer and returns the relations it reads
+    as ``(select_related, prefetch_related)`` lookup lists.
+
+    Nested serializers and dotted sources (``source='post.author'``) on
+    forward foreign keys become select_related lookups, nested lists and
+    many-to-many fields become prefetch_related lookups.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if model is None:
+        model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    select, prefetch = [], []
+    if model is None:
+        return select, prefetch
+
+    for field in serializer.fields.values():
+        if field.source == '*':
+            continue
+        nested = isinstance(field, serializers.BaseSerializer)
+        many = isinstance(field, (serializers.ListSerializer,
+                                  serializers.ManyRelatedField))
+        attrs = field.source_attrs if nested or many \
+            else field.source_attrs[:-1]
+
+        related_model, path = model, []
+        for attr in attrs:
+            try:
+                model_field = related_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not model_field.is_relation:
+                break
+            if model_field.many_to_many or model_field.one_to_many:
+                many = True
+            related_model = model_field.related_model
+            path.append(attr)
+        if not path:
+            continue
+
+        lookup = prefix + '__'.join(path)
+        (prefetch if many else select).append(lookup)
+        if nested:
+            child_select, child_prefetch = get_related_paths(
+                field, related_model, lookup + '__')
+            if many:
+                prefetch.extend(child_select + child_prefetch)
+            else:
+                select.extend(child_select)
+                prefetch.extend(child_prefetch)
+    return select, prefetch
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ModelSerializer for QuerySet.values() rows.
+
+    The fields, their order and the representation of decimals and dates
+    are taken from the given serializer, so the output is the same, but
+    rows are turned into dicts without instantiating models or running the
+    per-field ModelSerializer machinery. The serializer's derive() runs
+    once per page.
+    """
+    converted_fields = (
+        serializers.DecimalField, serializers.DateTimeField,
+        serializers.DateField, serializers.TimeField,
+    )
+
+    def __init__(self, serializer, prefix=''):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.derive = getattr(serializer, 'derive', None)
+        self.columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = prefix + '__'.join(field.source_attrs)
+            if isinstance(field, serializers.BaseSerializer):
+                self.columns.append(
+                    (name, None, ValuesSerializer(field, lookup + '__')))
+            elif isinstance(field, (serializers.SerializerMethodField,
+                                    serializers.ManyRelatedField)):
+                raise TypeError(
+                    "%s can't be read from values() rows." % name)
+            elif isinstance(field, self.converted_fields):
+                self.columns.append((name, lookup, field.to_representation))
+            else:
+                self.columns.append((name, lookup, None))
+
+    @property
+    def lookups(self):
+        lookups = []
+        for name, lookup, convert in self.columns:
+            if lookup is None:
+                lookups.extend(convert.lookups)
+            else:
+                lookups.append(lookup)
+        return lookups
+
+    def to_representation(self, row):
+        ret = self._to_representation(row)
+        if self.derive is not None:
+            ret = self.derive([ret])[0]
+        return ret
+
+    def to_representation_many(self, rows):
+        with timed('serialize'):
+            ret = [self._to_representation(row) for row in rows]
+            if self.derive is not None:
+                ret = self.derive(ret)
+            return ret
+
+    def _to_representation(self, row):
+        ret = {}
+        for name, lookup, convert in self.columns:
+            if lookup is None:
+                ret[name] = convert.to_representation(row)
+                continue
+            value = row[lookup]
+            if value is not None and convert is not None:
+                value = convert(value)
+            ret[name] = value
+        return ret
+
+
+class DerivedFieldsMixin:
+    """
+    Adds the fields computed by derive() to the representation. derive
+    takes a list of representations, so ValuesSerializer can run it once
+    per page.
+    """
+    derive = None
+
+    def to_representation(self, instance):
+        return self.derive([super().to_representation(instance)])[0]
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class AccountSerializer(DerivedFieldsMixin, serializers.ModelSerializer):
+    derive = staticmethod(add_account_fields)
+
     class Meta:
         model = Account
         fields = ('__all__')
@@ -30,8 +191,9 @@ class PostSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
-class PostCacheSerializer(serializers.ModelSerializer):
+class PostCacheSerializer(DerivedFieldsMixin, DynamicFieldsModelSerializer):
     post = LightPostSerializer()
+    derive = staticmethod(add_post_fields)
 
     class Meta:
         model = PostCache
@@ -44,50 +206,121 @@ class HiveStateSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
-class AccountFollowerSerializer(serializers.ModelSerializer):
-    followers = serializers.SerializerMethodField()
+class FollowSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    created_at = serializers.DateTimeField()
+
+
+class FeedPostSerializer(DerivedFieldsMixin, serializers.ModelSerializer):
+    derive = staticmethod(add_post_fields)
 
     class Meta:
-        model = Account
-        fields = ['followers']
+        model = PostCache
+        fields = (
+            'post_id', 'author', 'permlink', 'category', 'depth', 'children',
+            'author_rep', 'total_votes', 'up_votes', 'title', 'preview',
+            'img_url', 'payout', 'promoted', 'created_at', 'payout_at',
+            'is_paidout', 'is_nsfw',
+        )
+
 
-    def get_followers(self, obj):
-        return obj.follower_list
+class FeedSerializer(serializers.ModelSerializer):
+    post = FeedPostSerializer()
 
+    class Meta:
+        model = FeedCache
+        fields = ('created_at', 'post')
 
-class AccountFollowingSerializer(serializers.ModelSerializer):
-    following = serializers.SerializerMethodField()
+
+class PaymentSerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='post.author')
+    permlink = serializers.CharField(source='post.permlink')
+    from_account = serializers.CharField(source='from_account.name')
+    to_account = serializers.CharField(source='to_account.name')
 
     class Meta:
-        model = Account
-        fields = ['following']
+        model = Payment
+        fields = (
+            'block_num', 'tx_idx', 'author', 'permlink', 'from_account',
+            'to_account', 'amount', 'token',
+        )
 
-    def get_following(self, obj):
-        return obj.following_list
 
+class PaymentTotalSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    sent = serializers.DecimalField(max_digits=20, decimal_places=3)
+    received = serializers.DecimalField(max_digits=20, decimal_places=3)
+    payments = serializers.IntegerField()
 
-class AccountMuterSerializer(serializers.ModelSerializer):
-    muters = serializers.SerializerMethodField()
 
-    class Meta:
-        model = Account
-        fields = ['muters']
+class DailyPaymentTotalSerializer(PaymentTotalSerializer):
+    day = serializers.DateField()
 
-    def get_muters(self, obj):
-        return obj.muter_list
 
+class PostPaymentTotalSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=20, decimal_places=3)
+    payments = serializers.IntegerField()
+    accounts = serializers.IntegerField()
 
-class AccountMutingSerializer(serializers.ModelSerializer):
-    muting = serializers.SerializerMethodField()
+
+class BlockReblogSerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='post.author')
+    permlink = serializers.CharField(source='post.permlink')
 
     class Meta:
-        model = Account
-        fields = ['muting']
+        model = Reblog
+        fields = ('account', 'author', 'permlink', 'created_at')
 
-    def get_muting(self, obj):
-        return obj.muted_list
 
 class ReblogSerializer(serializers.Serializer):
     author = serializers.CharField(source='post__author')
     permlink = serializers.CharField(source='post__permlink')
     created_at = serializers.DateTimeField()
+
+
+class PostKeySerializer(serializers.Serializer):
+    author = serializers.CharField(max_length=16)
+    permlink = serializers.CharField(max_length=255)
+
+
+class PostBatchSerializer(serializers.Serializer):
+    posts = PostKeySerializer(many=True)
+
+    def validate_posts(self, posts):
+        max_size = self.context['max_size']
+        if len(posts) > max_size:
+            raise serializers.ValidationError(
+                "At most %s posts can be requested at once." % max_size)
+        return posts
+
+
+class CommunitySerializer(DerivedFieldsMixin, serializers.ModelSerializer):
+    name = serializers.CharField(source='name_id')
+    derive = staticmethod(add_community_fields)
+
+    class Meta:
+        model = Community
+        fields = (
+            'name', 'title', 'about', 'description', 'lang', 'type_id',
+            'is_nsfw', 'created_at', 'settings',
+        )
+
+
+class MemberSerializer(serializers.ModelSerializer):
+    account = serializers.CharField(source='account_id')
+
+    class Meta:
+        model = Member
+        fields = (
+            'account', 'title', 'is_admin', 'is_mod', 'is_approved',
+            'is_muted',
+        )
+
+
+class ModlogSerializer(serializers.ModelSerializer):
+    account = serializers.CharField(source='account_id')
+
+    class Meta:
+        model = Modlog
+        fields = ('id', 'account', 'action', 'params', 'created_at')
@@ -0,0 +1,155 @@
+import csv
+import json
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamingMixin:
+    """
+    Lets viewset actions stream a whole queryset as NDJSON or CSV instead
+    of paginating it.
+
+    Rows are pulled with QuerySet.iterator(), which uses a server-side
+    cursor on Postgres, and encoded one by one so the worker memory stays
+    flat regardless of the result size.
+
+    The cursor is read inside a transaction: in autocommit mode Django
+    declares it WITH HOLD, and Postgres then materializes the whole result
+    before sending the first row. The transaction also scopes the longer
+    EXPORT_STATEMENT_TIMEOUT to the export.
+    """
+    stream_query_param = 'stream'
+    stream_formats = ('ndjson', 'csv')
+    stream_content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv; charset=utf-8',
+    }
+    stream_chunk_size = 2000
+
+    def get_stream_format(self):
+        stream_format = self.request.query_params.get(self.stream_query_param)
+        if not stream_format:
+            return None
+        if stream_format not in self.stream_formats:
+            raise ValidationError({
+                self.stream_query_param: 'Supported formats: %s' % ", ".join(
+                    self.stream_formats)})
+        return stream_format
+
+    def stream_response(self, queryset, serializer):
+        """
+        Streams the queryset in the requested format. The serializer only
+        needs a to_representation() for a single row, so ValuesSerializer
+        instances work for values() querysets. Serializers with a
+        to_representation_many() are given a chunk of rows at a time.
+        """
+        stream_format = self.get_stream_format() or self.stream_formats[0]
+        source = rows = self._iter_rows(queryset, self.stream_chunk_size)
+        # run the query before the response starts, so that a failure is
+        # still an error response instead of a truncated 200
+        first = next(rows, None)
+        rows = chain([first], rows) if first is not None else iter(())
+        if hasattr(serializer, 'to_representation_many'):
+            rows = self._represent_chunks(
+                serializer, rows, self.stream_chunk_size)
+        else:
+            rows = (serializer.to_representation(row) for row in rows)
+        encode = getattr(self, 'encode_%s' % stream_format)
+        return StreamingHttpResponse(
+            _ClosingIterator(encode(rows), source),
+            content_type=self.stream_content_types[stream_format])
+
+    @staticmethod
+    def _iter_rows(queryset, chunk_size):
+        using = queryset.db
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [
+                    settings.TOWER_DB['EXPORT_STATEMENT_TIMEOUT']])
+            yield from queryset.iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def _represent_chunks(serializer, rows, size):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, size))
+            if not chunk:
+                return
+            yield from serializer.to_representation_many(chunk)
+
+    @staticmethod
+    def encode_ndjson(rows):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + "\n"
+
+    @classmethod
+    def encode_csv(cls, rows):
+        """
+        Writes a header from the keys of the first row, nested objects
+        become dotted columns (post.id).
+        """
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer)
+        header = None
+        for row in rows:
+            row = cls._flatten(row)
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header)
+            yield writer.writerow([
+                cls._csv_value(row.get(column)) for column in header])
+
+    @classmethod
+    def _flatten(cls, row, prefix=''):
+        flat = {}
+        for key, value in row.items():
+            if isinstance(value, dict):
+                flat.update(cls._flatten(value, '%s%s.' % (prefix, key)))
+            else:
+                flat[prefix + key] = value
+        return flat
+
+    @staticmethod
+    def _csv_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (list, tuple)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+
+class _LineBuffer:
+    """
+    A file-like object for csv.writer that hands the written line back
+    instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+class _ClosingIterator:
+    """
+    Streamed content that closes the row generator along with the
+    response, so an aborted download ends the export transaction and its
+    cursor right away instead of when they are garbage collected.
+    """
+
+    def __init__(self, content, rows):
+        self.content = content
+        self.rows = rows
+
+    def __iter__(self):
+        return self.content
+
+    def close(self):
+        self.content.close()
+        self.rows.close()
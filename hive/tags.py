@@ -0,0 +1,63 @@
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from .cache import get_cache
+from .models import PostCache, PostTag
+
+TAG_STATS_KEY = 'tower:tag_stats'
+TAG_STATS_TTL = 60 * 60
+
+
+def get_tag_frequencies():
+    """
+    Returns the fraction of hive_post_tags rows for the most common tags,
+    read from the planner statistics (pg_stats) instead of counting rows.
+    Tags missing from the result are rarer than any tag in it.
+    """
+    cache = get_cache()
+    frequencies = cache.get(TAG_STATS_KEY)
+    if frequencies is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT most_common_vals::text::text[], most_common_freqs "
+                "FROM pg_stats "
+                "WHERE tablename = 'hive_post_tags' AND attname = 'tag'")
+            row = cursor.fetchone()
+        frequencies = dict(zip(row[0], row[1])) if row and row[0] else {}
+        cache.set(TAG_STATS_KEY, frequencies, TAG_STATS_TTL)
+    return frequencies
+
+
+def _has_tags(tags):
+    return Exists(PostTag.objects.filter(
+        post_id=OuterRef('pk'), tag__in=tags).values('post_id'))
+
+
+def filter_by_tags(queryset=None, all_tags=(), any_tags=(), none_tags=()):
+    """
+    Filters the post cache by tags in a single statement, newest first.
+
+    The rarest of ``all_tags`` (by planner statistics) is joined directly
+    and the remaining conditions become EXISTS clauses, so ordering and
+    LIMIT stay in SQL and no post id list is materialized in Python.
+    """
+    if queryset is None:
+        queryset = PostCache.objects.all()
+    if not all_tags and not any_tags:
+        raise ValueError("At least one 'all' or 'any' tag is required.")
+
+    if all_tags:
+        frequencies = get_tag_frequencies()
+        all_tags = sorted(set(all_tags), key=lambda t: frequencies.get(t, 0))
+        queryset = queryset.filter(post__posttag__tag=all_tags[0])
+        for i, tag in enumerate(all_tags[1:]):
+            queryset = queryset.annotate(
+                **{'_has_all_%s' % i: _has_tags([tag])}).filter(
+                **{'_has_all_%s' % i: True})
+    if any_tags:
+        queryset = queryset.annotate(_has_any=_has_tags(any_tags)).filter(
+            _has_any=True)
+    if none_tags:
+        queryset = queryset.annotate(_has_none=_has_tags(none_tags)).filter(
+            _has_none=False)
+    return queryset.order_by('-created_at')
@@ -1,3 +1,1184 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import InterfaceError, OperationalError, connection
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.runner import DiscoverRunner
+from django.utils import timezone
+from psycopg2 import errorcodes
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .constants import FOLLOW_STATE_FOLLOWING
+from .cache import LRUCache, get_cache, get_request_fingerprint
+from .management.commands.benchmark_endpoints import (
+    BODIES, SCENARIOS, SKIPPED, get_url_names
+)
+from .db import QueryTimeoutMiddleware, ReplicaRouter
+from .derived import reputation_score
+from .events import BlockWatcher
+from .metrics import Registry
+from .pagination import EstimatedCountMixin, TowerCursorPagination
+from .rankings import snapshots
+from .models import (
+    Account, Block, Community, FeedCache, Follow, Member, Modlog, Payment,
+    Post, PostCache, PostTag, Reblog, State
+)
+from .serializers import (
+    AccountSerializer, BlockSerializer, PostCacheSerializer, ValuesSerializer
+)
+from .streaming import StreamingMixin
+from .votes import iter_votes, vote_cache
+
+
+class HiveTestRunner(DiscoverRunner):
+    """
+    Hivemind owns the schema, so the hive models are unmanaged and have no
+    migrations. Flip them to managed while the tests run and let the test
+    database create their tables with syncdb.
+    """
+
+    def setup_databases(self, **kwargs):
+        with override_settings(MIGRATION_MODULES={'hive': None}):
+            return super().setup_databases(**kwargs)
+
+    def setup_test_environment(self, **kwargs):
+        self.unmanaged_models = [
+            model for model in apps.get_app_config('hive').get_models()
+            if not model._meta.managed]
+        for model in self.unmanaged_models:
+            model._meta.managed = True
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        for model in self.unmanaged_models:
+            model._meta.managed = False
+
+
+def create_account(name, **kwargs):
+    now = timezone.now()
+    defaults = dict(
+        created_at=now, reputation=0, profile_image='', cover_image='',
+        followers=0, following=0, proxy='', post_count=0, proxy_weight=0,
+        vote_weight=0, kb_used=0, rank=0, active_at=now, cached_at=now,
+    )
+    defaults.update(kwargs)
+    return Account.objects.create(name=name, **defaults)
+
+
+def create_post(author, permlink, tags=(), **kwargs):
+    created_at = kwargs.pop('created_at', timezone.now())
+    post = Post.objects.create(
+        author=author, permlink=permlink, community=author,
+        category=tags[0] if tags else '', depth=0, created_at=created_at,
+        is_deleted=False, is_pinned=False, is_muted=False, is_valid=True,
+        promoted=0)
+    for tag in tags:
+        PostTag.objects.create(post=post, tag=tag)
+    defaults = dict(
+        category=post.category, depth=0, children=0, author_rep=25,
+        flag_weight=0, total_votes=1, up_votes=1, title=permlink,
+        preview='', img_url='', payout=Decimal('1.000'), promoted=0,
+        created_at=created_at, payout_at=created_at, updated_at=created_at,
+        is_paidout=False, is_nsfw=False, is_declined=False,
+        is_full_power=False, is_hidden=False, is_grayed=False, rshares=1,
+        sc_trend=0, sc_hot=0, body='body', votes='voter,1,100,25',
+        json='{}', raw_json='{}',
+    )
+    defaults.update(kwargs)
+    PostCache.objects.create(
+        post=post, author=author, permlink=permlink, **defaults)
+    return post
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    TOWER_CACHE={'ALIAS': 'default', 'TIMEOUT': 0, 'HEAD_BLOCK_TTL': 0,
+                 'TIMEOUTS': {}},
+)
+class HiveTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        State.objects.create(
+            block_num=10, db_version=1, steem_per_mvest=Decimal('495.000'),
+            usd_per_steem=Decimal('1.000'), sbd_per_steem=Decimal('1.000'),
+            dgpo='{}')
+        for num in range(1, 11):
+            Block.objects.create(
+                num=num, hash='%040d' % num, txs=1, ops=1,
+                created_at=now - timedelta(seconds=3 * (10 - num)))
+        accounts = [create_account('user%s' % i) for i in range(10)]
+        for i, account in enumerate(accounts):
+            post = create_post(
+                account.name, 'post-%s' % i, tags=('life', 'photography'),
+                created_at=now - timedelta(minutes=i))
+            Reblog.objects.create(
+                account='user0', post=post, created_at=now)
+            if i:
+                Follow.objects.create(
+                    follower=account, following=accounts[0],
+                    state=FOLLOW_STATE_FOLLOWING, created_at=now)
+                FeedCache.objects.create(
+                    post_id=post.id, account=accounts[0],
+                    created_at=now - timedelta(minutes=i))
+
+
+class QueryCountTestCase(HiveTestCase):
+    """
+    Asserts the number of queries per endpoint, so that the count doesn't
+    grow with the page size.
+    """
+
+    def assertEndpointQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_post_cache_list(self):
+        # head block, count estimate, count, page (joined with hive_posts)
+        response = self.assertEndpointQueries(4, '/api/v1/post_cache/')
+        self.assertNotIn('body', response.json()['results'][0])
+
+    def test_post_cache_list_with_fields(self):
+        response = self.assertEndpointQueries(
+            4, '/api/v1/post_cache/?fields=title,body')
+        self.assertEqual(
+            set(response.json()['results'][0]), {'title', 'body'})
+
+    def test_post_cache_detail(self):
+        self.assertEndpointQueries(1, '/api/v1/post_cache/user1/post-1/')
+
+    def test_post_cache_filter_by_tags(self):
+        # tag statistics, page
+        response = self.assertEndpointQueries(
+            2, '/api/v1/post_cache/filter_by_tags/'
+               '?[]exact=life&[]exact=photography&limit=10')
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_post_cache_reblogs(self):
+        self.assertEndpointQueries(
+            2, '/api/v1/post_cache/user1/post-1/reblogs/')
+
+    def test_account_list(self):
+        # the head block's state, for steem_power, is cached outside tests
+        self.assertEndpointQueries(5, '/api/v1/accounts/')
+
+    def test_account_followers(self):
+        response = self.assertEndpointQueries(
+            2, '/api/v1/accounts/user0/followers/')
+        self.assertEqual(len(response.json()['results']), 9)
+
+    def test_account_feed(self):
+        response = self.assertEndpointQueries(
+            2, '/api/v1/accounts/user0/feed/?limit=5')
+        data = response.json()
+        self.assertEqual(
+            [entry['post']['permlink'] for entry in data['results']],
+            ['post-1', 'post-2', 'post-3', 'post-4', 'post-5'])
+        self.assertNotIn('body', data['results'][0]['post'])
+        response = self.client.get(data['next'])
+        self.assertEqual(
+            [entry['post']['permlink'] for entry in
+             response.json()['results']],
+            ['post-6', 'post-7', 'post-8', 'post-9'])
+
+    def test_account_reblogs(self):
+        self.assertEndpointQueries(5, '/api/v1/accounts/user0/reblogs/')
+
+    def test_block_list(self):
+        self.assertEndpointQueries(4, '/api/v1/blocks/')
+
+    def test_block_list_without_count(self):
+        response = self.assertEndpointQueries(
+            1, '/api/v1/blocks/?count=false&limit=5')
+        data = response.json()
+        self.assertIsNone(data['count'])
+        self.assertIn('offset=5', data['next'])
+
+
+class KeysetPaginationTestCase(HiveTestCase):
+
+    def paginate(self, queryset, url):
+        paginator = TowerCursorPagination()
+        request = Request(APIRequestFactory().get(url))
+        page = paginator.paginate_queryset(queryset, request)
+        return ([account.name for account in page],
+                paginator.get_next_link(), paginator.get_previous_link())
+
+    def walk(self, queryset):
+        names, url = [], '/?limit=3'
+        while url:
+            page, url, _ = self.paginate(queryset, url)
+            names += page
+        return names
+
+    def test_pages(self):
+        queryset = Account.objects.order_by('-name')
+        self.assertEqual(self.walk(queryset), ['user%s' % i for i in range(
+            9, -1, -1)])
+        first, next_link, previous_link = self.paginate(queryset, '/?limit=3')
+        self.assertIsNone(previous_link)
+        second, _, previous_link = self.paginate(queryset, next_link)
+        self.assertEqual(second, ['user6', 'user5', 'user4'])
+        self.assertEqual(self.paginate(queryset, previous_link)[0], first)
+
+    def test_nullable_ordering(self):
+        Account.objects.filter(name__in=['user2', 'user5']).update(
+            location='berlin')
+        Account.objects.filter(name='user7').update(location='athens')
+        for ordering in ('location', '-location'):
+            queryset = Account.objects.order_by(ordering)
+            self.assertEqual(
+                self.walk(queryset),
+                list(queryset.order_by(ordering, ordering.replace(
+                    'location', 'id')).values_list('name', flat=True)))
+
+    def test_offset_is_rejected(self):
+        response = self.client.get(
+            '/api/v1/post_cache/filter_by_tags/?[]exact=life&offset=5')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json()['offset'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', 'eyJwIjpbXX0='):
+            response = self.client.get(
+                '/api/v1/accounts/user0/followers/?cursor=%s' % cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('cursor', response.json())
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'response-cache-tests'}},
+    TOWER_CACHE={'ALIAS': 'default', 'TIMEOUT': 60, 'HEAD_BLOCK_TTL': 0,
+                 'TIMEOUTS': {}},
+)
+class ResponseCacheTestCase(HiveTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.addCleanup(get_cache().clear)
+
+    def test_hit(self):
+        miss = self.client.get('/api/v1/accounts/user1/')
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            hit = self.client.get('/api/v1/accounts/user1/')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit['ETag'], miss['ETag'])
+        for header in ('Content-Type', 'Allow', 'X-Frame-Options'):
+            self.assertEqual(hit[header], miss[header])
+        self.assertIn('Origin', hit['Vary'])
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/v1/accounts/user1/')['ETag']
+        response = self.client.get(
+            '/api/v1/accounts/user1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_new_block_invalidates(self):
+        etag = self.client.get('/api/v1/accounts/user1/')['ETag']
+        State.objects.create(
+            block_num=11, db_version=1, steem_per_mvest=Decimal('495.000'),
+            usd_per_steem=Decimal('1.000'), sbd_per_steem=Decimal('1.000'),
+            dgpo='{}')
+        response = self.client.get(
+            '/api/v1/accounts/user1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_forged_etag(self):
+        request = RequestFactory().get('/api/v1/accounts/nobody/')
+        etag = '"10-%s"' % get_request_fingerprint(request)
+        response = self.client.get(
+            '/api/v1/accounts/nobody/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+
+class EstimatedCountTestCase(HiveTestCase):
+
+    def test_exact_count(self):
+        data = self.client.get('/api/v1/blocks/?limit=3').json()
+        self.assertEqual(data['count'], 10)
+        self.assertFalse(data['count_estimated'])
+
+    def test_estimated_count(self):
+        with mock.patch.object(
+                EstimatedCountMixin, 'estimate_threshold', 1):
+            data = self.client.get('/api/v1/blocks/?limit=3').json()
+        self.assertTrue(data['count_estimated'])
+        self.assertIn('offset=3', data['next'])
+
+    def test_last_page(self):
+        data = self.client.get('/api/v1/blocks/?limit=5&offset=5').json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+
+
+class DerivedFieldsTestCase(HiveTestCase):
+
+    def test_reputation_score(self):
+        self.assertEqual(reputation_score(0), 25)
+        self.assertEqual(reputation_score(10 ** 12), 52)
+        self.assertEqual(reputation_score(-10 ** 12), -2)
+        self.assertEqual(reputation_score(10 ** 8), 25)
+
+    def test_account_fields(self):
+        Account.objects.filter(name='user1').update(
+            reputation=10 ** 12, vote_weight=2 * 10 ** 6)
+        expected = {'reputation_score': 52.0, 'steem_power': 990.0,
+                    'steem_power_usd': 990.0, 'steem_power_sbd': 990.0}
+        detail = self.client.get('/api/v1/accounts/user1/').json()
+        rows = self.client.get('/api/v1/accounts/?names=user1').json()
+        exported = self.client.get('/api/v1/accounts/?stream=ndjson')
+        exported = [json.loads(line) for line in
+                    b''.join(exported.streaming_content).splitlines()]
+        for account in (detail, rows['results'][0],
+                        [a for a in exported if a['name'] == 'user1'][0]):
+            self.assertEqual(
+                {key: account[key] for key in expected}, expected)
+
+    def test_post_fields(self):
+        data = self.client.get(
+            '/api/v1/post_cache/?fields=author,author_rep').json()
+        self.assertEqual(data['results'][0]['author_rep_score'], 25.0)
+        data = self.client.get('/api/v1/post_cache/?fields=author').json()
+        self.assertNotIn('author_rep_score', data['results'][0])
+
+
+class GuardrailsTestCase(HiveTestCase):
+
+    @override_settings(TOWER_GUARDRAILS={'MAX_COST': 0.01})
+    def test_expensive_ordering_is_rejected(self):
+        response = self.client.get('/api/v1/accounts/?ordering=post_count')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vote_weight', response.json()['detail'])
+
+    @override_settings(TOWER_GUARDRAILS={'MAX_COST': 0.01})
+    def test_indexed_ordering_skips_explain(self):
+        with mock.patch('hive.guardrails.get_query_cost') as get_query_cost:
+            response = self.client.get(
+                '/api/v1/accounts/?ordering=-vote_weight&name=user1')
+        self.assertEqual(response.status_code, 200)
+        get_query_cost.assert_not_called()
+
+    def test_unindexed_lookups_are_explained(self):
+        for url in ('/api/v1/accounts/?name__startswith=u',
+                    '/api/v1/accounts/?name__contains=ser',
+                    '/api/v1/post_cache/?permlink=post-1'):
+            with mock.patch('hive.guardrails.get_query_cost',
+                            return_value=0) as get_query_cost:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            get_query_cost.assert_called_once()
+
+    @override_settings(TOWER_GUARDRAILS={'MAX_COST': 0.01})
+    def test_exports_are_not_checked(self):
+        response = self.client.get(
+            '/api/v1/blocks/?ordering=txs&stream=ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(b''.join(response.streaming_content).splitlines()), 10)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_costs_are_cached_per_query_shape(self):
+        self.client.get('/api/v1/blocks/?ordering=txs&from_num=1')
+        with mock.patch('hive.guardrails.connections') as connections:
+            response = self.client.get('/api/v1/blocks/?ordering=txs&from_num=2')
+        self.assertEqual(response.status_code, 200)
+        connections.__getitem__.assert_not_called()
+
+    def test_unknown_post_ordering_is_ignored(self):
+        data = self.client.get('/api/v1/post_cache/?ordering=body').json()
+        self.assertEqual(data['results'][0]['permlink'], 'post-9')
+
+    def test_statement_timeout(self):
+        cause = Exception('canceling statement due to statement timeout')
+        cause.pgcode = errorcodes.QUERY_CANCELED
+        error = OperationalError(*cause.args)
+        error.__cause__ = cause
+        response = QueryTimeoutMiddleware(None).process_exception(None, error)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['code'], 'query_timeout')
+
+
+class RankingTestCase(HiveTestCase):
+
+    def setUp(self):
+        snapshots.clear()
+
+    def test_trending(self):
+        for i, permlink in enumerate(['post-4', 'post-7', 'post-2']):
+            PostCache.objects.filter(permlink=permlink).update(
+                sc_trend=10 - i)
+        # head block, snapshot, page
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/v1/post_cache/trending/?limit=3&fields=permlink')
+        self.assertEqual(
+            [post['permlink'] for post in response.json()['results']],
+            ['post-4', 'post-7', 'post-2'])
+        with self.assertNumQueries(2):
+            self.client.get('/api/v1/post_cache/trending/?limit=3&offset=3')
+
+    def test_scopes(self):
+        PostCache.objects.filter(permlink='post-3').update(is_paidout=True)
+        response = self.client.get(
+            '/api/v1/post_cache/hot/?community=user3')
+        self.assertEqual(response.json()['count'], 0)
+        response = self.client.get(
+            '/api/v1/post_cache/created/?community=user3')
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get(
+            '/api/v1/post_cache/created/?tag=life')
+        self.assertEqual(response.json()['count'], 10)
+
+    def test_cursor_is_rejected(self):
+        response = self.client.get('/api/v1/post_cache/trending/?cursor=')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+
+class StreamingTestCase(HiveTestCase):
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return response, content.splitlines()
+
+    def test_blocks_csv(self):
+        response, lines = self.stream('/api/v1/blocks/?stream=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(lines[0], 'num,hash,txs,ops,created_at,prev')
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(lines[1].startswith('10,'))
+
+    def test_accounts_ndjson_respects_filters(self):
+        Account.objects.filter(name='user2').update(location='istanbul')
+        response, lines = self.stream(
+            '/api/v1/accounts/?stream=ndjson&location=istanbul')
+        self.assertEqual(
+            [json.loads(line)['name'] for line in lines], ['user2'])
+
+    def test_nested_csv_columns(self):
+        _, lines = self.stream(
+            '/api/v1/post_cache/?stream=csv&fields=permlink,post')
+        self.assertTrue(lines[0].startswith('post.id,post.is_deleted,'))
+        self.assertIn(',false,', lines[1])
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/v1/blocks/?stream=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    TOWER_CACHE={'ALIAS': 'default', 'TIMEOUT': 0, 'HEAD_BLOCK_TTL': 0,
+                 'TIMEOUTS': {}},
+)
+class ExportTransactionTestCase(TransactionTestCase):
+    """
+    TestCase wraps every test in a transaction, which hides how exports
+    run in autocommit mode.
+    """
+
+    def test_export_runs_in_a_transaction(self):
+        for i in range(3):
+            create_account('user%s' % i)
+        seen = []
+        encode_ndjson = StreamingMixin.encode_ndjson
+
+        def encode(rows):
+            for line in encode_ndjson(rows):
+                with connection.cursor() as cursor:
+                    cursor.execute("SHOW statement_timeout")
+                    seen.append((connection.get_autocommit(),
+                                 cursor.fetchone()[0]))
+                yield line
+
+        # with a chunk per row, every row is encoded while the cursor is
+        # still being read
+        with mock.patch.object(
+                StreamingMixin, 'encode_ndjson', staticmethod(encode)), \
+                mock.patch.object(StreamingMixin, 'stream_chunk_size', 1), \
+                override_settings(TOWER_DB=dict(
+                    settings.TOWER_DB, EXPORT_STATEMENT_TIMEOUT=123000)):
+            response = self.client.get('/api/v1/accounts/?stream=ndjson')
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        # no WITH HOLD cursor, and the export timeout only while streaming
+        self.assertEqual(seen, [(False, '123s')] * 3)
+        self.assertTrue(connection.get_autocommit())
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            self.assertNotEqual(cursor.fetchone()[0], '123s')
+
+    def test_closing_the_response_ends_the_transaction(self):
+        for i in range(3):
+            create_account('user%s' % i)
+        with mock.patch.object(StreamingMixin, 'stream_chunk_size', 1):
+            response = self.client.get('/api/v1/accounts/?stream=ndjson')
+            self.assertFalse(connection.get_autocommit())
+            response.close()
+        self.assertTrue(connection.get_autocommit())
+        self.assertFalse(connection.in_atomic_block)
+
+
+class BlockTestCase(HiveTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        block = Block.objects.get(num=5)
+        post = create_post(
+            'user1', 'in-block-5', created_at=block.created_at)
+        Reblog.objects.create(
+            account='user2', post=post, created_at=block.created_at)
+        Payment.objects.create(
+            block_num=5, tx_idx=0, post=post,
+            from_account=Account.objects.get(name='user2'),
+            to_account=Account.objects.get(name='user1'),
+            amount=Decimal('1.000'), token='SBD')
+
+    def test_range(self):
+        response = self.client.get(
+            '/api/v1/blocks/?from_num=3&to_num=6&ordering=num')
+        self.assertEqual(
+            [block['num'] for block in response.json()['results']],
+            [3, 4, 5, 6])
+
+    def test_contents(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                '/api/v1/blocks/contents/?from_num=4&to_num=6')
+        blocks = response.json()
+        self.assertEqual([block['num'] for block in blocks], [4, 5, 6])
+        self.assertEqual(
+            [post['permlink'] for post in blocks[1]['posts']],
+            ['in-block-5'])
+        self.assertEqual(blocks[1]['reblogs'][0]['account'], 'user2')
+        self.assertEqual(blocks[1]['payments'][0]['from_account'], 'user2')
+        self.assertEqual(blocks[0]['posts'], [])
+
+    def test_block_contents(self):
+        response = self.client.get('/api/v1/blocks/5/contents/')
+        self.assertEqual(response.json()['payments'][0]['amount'], '1.000')
+
+    def test_contents_limit(self):
+        response = self.client.get(
+            '/api/v1/blocks/contents/?from_num=1&to_num=1001')
+        self.assertEqual(response.status_code, 400)
+
+
+class BlockEventsTestCase(HiveTestCase):
+
+    def setUp(self):
+        self.watcher = BlockWatcher()
+        self.watcher.check()
+        for target in ('hive.views.watcher', 'hive.events.watcher'):
+            patcher = mock.patch(target, self.watcher)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.watcher, 'ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def advance(self):
+        Block.objects.create(
+            num=11, hash='%040d' % 11, txs=1, ops=1, created_at=timezone.now())
+        State.objects.create(
+            block_num=11, db_version=1, steem_per_mvest=Decimal('495.000'),
+            usd_per_steem=Decimal('1.000'), sbd_per_steem=Decimal('1.000'),
+            dgpo='{}')
+        self.watcher.check()
+
+    def test_watcher(self):
+        self.assertEqual(
+            [event['num'] for event in self.watcher.wait()], [10])
+        self.assertEqual(self.watcher.wait(after_block=10), [])
+        self.advance()
+        self.assertEqual(
+            [event['num'] for event in self.watcher.wait(after_block=9)],
+            [10, 11])
+
+    def test_watcher_survives_errors(self):
+        class Stop(BaseException):
+            pass
+
+        watcher = BlockWatcher()
+        with mock.patch.object(watcher, 'check', side_effect=[
+                InterfaceError('connection already closed'),
+                RuntimeError('bug'), Stop]) as check, \
+                mock.patch.object(watcher, 'sleep'), \
+                mock.patch('hive.events.connection') as events_connection, \
+                mock.patch('hive.events.time.sleep'), \
+                mock.patch('hive.events.logger'):
+            with self.assertRaises(Stop):
+                watcher.run()
+        self.assertEqual(check.call_count, 3)
+        self.assertEqual(events_connection.close.call_count, 2)
+
+    def test_dead_thread_is_restarted(self):
+        watcher = BlockWatcher()
+        with mock.patch('hive.events.threading.Thread') as thread:
+            watcher.ensure_started()
+            watcher.ensure_started()
+            self.assertEqual(thread.call_count, 1)
+            thread.return_value.is_alive.return_value = False
+            watcher.ensure_started()
+            self.assertEqual(thread.call_count, 2)
+
+    def test_long_poll(self):
+        self.advance()
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/v1/state/blocks/?after_block=10&timeout=0')
+        self.assertEqual(
+            [event['num'] for event in response.json()], [11])
+
+    def test_non_finite_timeouts(self):
+        for timeout in ('nan', 'inf', '-inf'):
+            response = self.client.get(
+                '/api/v1/state/blocks/?after_block=10&timeout=' + timeout)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('timeout', response.json())
+        self.assertEqual(
+            self.watcher.wait(after_block=10, timeout=float('nan')), [])
+
+    def test_server_sent_events(self):
+        response = self.client.get(
+            '/api/v1/state/stream/', HTTP_LAST_EVENT_ID='9')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        self.assertTrue(next(chunks).startswith(b'id: 10\nevent: block\n'))
+
+
+class SearchTestCase(HiveTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        create_post('user1', 'tips', title='Photography tips',
+                    body='Shooting landscapes at sunset')
+        create_post('user2', 'diary', title='Diary',
+                    body='Sunsets, and more sunsets')
+
+    def test_account_prefix(self):
+        create_account('other')
+        response = self.client.get(
+            '/api/v1/accounts/?name__startswith=user&ordering=name&limit=3')
+        self.assertEqual(
+            [account['name'] for account in response.json()['results']],
+            ['user0', 'user1', 'user2'])
+
+    def test_post_search(self):
+        response = self.client.get(
+            '/api/v1/post_cache/search/?q=sunset&fields=permlink')
+        results = response.json()['results']
+        self.assertEqual(
+            [post['permlink'] for post in results], ['diary', 'tips'])
+        self.assertGreater(
+            results[0]['search_rank'], results[1]['search_rank'])
+
+    def test_post_search_requires_text(self):
+        response = self.client.get('/api/v1/post_cache/search/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_search_indexes_dry_run(self):
+        out = StringIO()
+        call_command('create_search_indexes', dry_run=True, stdout=out)
+        self.assertIn('tower_posts_cache_document', out.getvalue())
+
+    def test_create_search_indexes_rebuilds_invalid_ones(self):
+        out, err = StringIO(), StringIO()
+        with mock.patch(
+                'hive.management.commands.create_search_indexes.Command.'
+                'get_invalid_indexes',
+                return_value={'tower_posts_cache_document'}):
+            call_command('create_search_indexes', dry_run=True, stdout=out,
+                         stderr=err)
+        statements = out.getvalue().splitlines()
+        self.assertEqual(statements[0], 'SET statement_timeout = 0')
+        drop = statements.index(
+            'DROP INDEX CONCURRENTLY IF EXISTS tower_posts_cache_document')
+        self.assertIn('tower_posts_cache_document', statements[drop + 1])
+        self.assertEqual(sum('DROP' in line for line in statements), 1)
+        self.assertIn('invalid', err.getvalue())
+
+
+class MetricsTestCase(HiveTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = mock.patch('hive.metrics.registry', Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def metrics_settings(self, **kwargs):
+        config = dict(
+            DIR=os.path.join(self.directory, 'metrics'), FLUSH_INTERVAL=0,
+            PROFILE_SAMPLE_RATE=0, PROFILE_SLOW_SECONDS=0,
+            PROFILE_DIR=os.path.join(self.directory, 'profiles'))
+        config.update(kwargs)
+        return override_settings(TOWER_METRICS=config)
+
+    def test_metrics(self):
+        with self.metrics_settings():
+            self.client.get('/api/v1/blocks/')
+            self.client.get('/api/v1/blocks/')
+            content = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'tower_requests_total{method="GET",status="200",'
+            'view="blocks-list"} 2', content)
+        self.assertIn(
+            'tower_request_duration_seconds_count{view="blocks-list"} 2',
+            content)
+        # head block, count estimate, count, page per request
+        self.assertIn('tower_db_queries_total{view="blocks-list"} 8', content)
+        self.assertIn('tower_serialize_seconds_total{view="blocks-list"}',
+                      content)
+
+    def test_exited_processes_are_archived(self):
+        exited = Registry()
+        exited.inc('tower_requests_total', {
+            'method': 'GET', 'status': 200, 'view': 'blocks-list'})
+        with self.metrics_settings():
+            self.client.get('/api/v1/blocks/')
+            directory = settings.TOWER_METRICS['DIR']
+            # a pid above the kernel's limit, its process is gone
+            with open(os.path.join(directory, '4194305.json'), 'w') as f:
+                json.dump(exited.dump(), f)
+            for _ in range(2):
+                content = self.client.get('/metrics').content.decode()
+                self.assertIn(
+                    'tower_requests_total{method="GET",status="200",'
+                    'view="blocks-list"} 2', content)
+        self.assertEqual(
+            sorted(name for name in os.listdir(directory)
+                   if name.endswith('.json')),
+            ['%s.json' % os.getpid(), 'exited.json'])
+
+    def test_slow_request_profiles(self):
+        with self.metrics_settings(PROFILE_SAMPLE_RATE=1):
+            self.client.get('/api/v1/blocks/')
+        profiles = os.listdir(os.path.join(self.directory, 'profiles'))
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith('-blocks-list.prof'))
+
+
+class BatchLookupTestCase(HiveTestCase):
+
+    def test_accounts_by_names(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/v1/accounts/?names=user3,nobody,user1')
+        data = response.json()
+        self.assertEqual(
+            [account and account['name'] for account in data['results']],
+            ['user3', None, 'user1'])
+        self.assertEqual(data['not_found'], [{'name': 'nobody'}])
+
+    def test_accounts_by_names_limit(self):
+        names = ','.join('user%s' % i for i in range(101))
+        response = self.client.get('/api/v1/accounts/?names=%s' % names)
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_cache_batch(self):
+        posts = [
+            {'author': 'user2', 'permlink': 'post-2'},
+            {'author': 'user2', 'permlink': 'missing'},
+            {'author': 'user1', 'permlink': 'post-1'},
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                '/api/v1/post_cache/batch/?fields=author,title',
+                {'posts': posts}, content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['results'], [
+            {'author': 'user2', 'title': 'post-2'},
+            None,
+            {'author': 'user1', 'title': 'post-1'},
+        ])
+        self.assertEqual(
+            data['not_found'], [{'author': 'user2', 'permlink': 'missing'}])
+
+    def test_post_cache_batch_limit(self):
+        posts = [{'author': 'user1', 'permlink': 'post-%s' % i}
+                 for i in range(101)]
+        response = self.client.post(
+            '/api/v1/post_cache/batch/', {'posts': posts},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CommunityTestCase(HiveTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        for name in ('hive-1', 'hive-2'):
+            create_account(name)
+            Community.objects.create(
+                name_id=name, title=name, about='', description='', lang='en',
+                settings='{}', type_id=1, is_nsfw=False, created_at=now)
+        for i in range(3):
+            Member.objects.create(
+                community_id='hive-1', account_id='user%s' % i,
+                is_admin=not i, is_mod=False, is_approved=True,
+                is_muted=False, title='')
+            Modlog.objects.create(
+                community_id='hive-1', account_id='user0', action='mute',
+                params='{}', created_at=now - timedelta(minutes=i))
+        for i in range(2):
+            post = create_post('user%s' % i, 'community-%s' % i,
+                               payout=Decimal('1.500'))
+            Post.objects.filter(pk=post.pk).update(community='hive-1')
+
+    def test_list(self):
+        # the summary's three aggregate queries are cached outside tests
+        with self.assertNumQueries(5):
+            data = self.client.get('/api/v1/communities/').json()
+        self.assertEqual(
+            [(c['name'], c['subscribers'], c['post_count'],
+              c['pending_payout']) for c in data['results']],
+            [('hive-1', 3, 2, '3.000'), ('hive-2', 0, 0, '0.000')])
+
+    def test_detail(self):
+        data = self.client.get('/api/v1/communities/hive-1/').json()
+        self.assertEqual(data['subscribers'], 3)
+
+    def test_members(self):
+        data = self.client.get(
+            '/api/v1/communities/hive-1/members/?limit=2').json()
+        self.assertEqual(
+            [m['account'] for m in data['results']], ['user0', 'user1'])
+        self.assertTrue(data['results'][0]['is_admin'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([m['account'] for m in data['results']], ['user2'])
+
+    def test_modlog(self):
+        data = self.client.get('/api/v1/communities/hive-1/modlog/').json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertGreater(data['results'][0]['created_at'],
+                           data['results'][1]['created_at'])
+
+
+class PaymentsTestCase(HiveTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        user0, user1 = Account.objects.get(name='user0'), \
+            Account.objects.get(name='user1')
+        post = Post.objects.get(author='user0', permlink='post-0')
+        for block_num, tx_idx, sender, receiver, amount, token in (
+                (3, 0, user1, user0, '1.000', 'SBD'),
+                (5, 1, user1, user0, '2.000', 'SBD'),
+                (5, 0, user1, user0, '0.500', 'STEEM'),
+                (7, 0, user0, user1, '0.250', 'SBD')):
+            Payment.objects.create(
+                block_num=block_num, tx_idx=tx_idx, post=post,
+                from_account=sender, to_account=receiver,
+                amount=Decimal(amount), token=token)
+
+    def test_history(self):
+        data = self.client.get(
+            '/api/v1/accounts/user1/payments/?limit=2').json()
+        self.assertEqual(
+            [(p['block_num'], p['tx_idx']) for p in data['results']],
+            [(7, 0), (5, 1)])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(
+            [(p['block_num'], p['tx_idx']) for p in data['results']],
+            [(5, 0), (3, 0)])
+        data = self.client.get(
+            '/api/v1/accounts/user1/payments/?direction=received').json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['from_account'], 'user0')
+
+    def test_totals(self):
+        with self.assertNumQueries(5):
+            data = self.client.get(
+                '/api/v1/accounts/user1/payments/totals/').json()
+        self.assertEqual(data['results'], [
+            {'token': 'SBD', 'sent': '3.000', 'received': '0.250',
+             'payments': 3},
+            {'token': 'STEEM', 'sent': '0.500', 'received': '0.000',
+             'payments': 1},
+        ])
+
+    def test_totals_ignore_cursors(self):
+        url = '/api/v1/accounts/user1/payments/totals/'
+        data = self.client.get(url + '?cursor=').json()
+        self.assertEqual(data['results'], self.client.get(url).json()[
+            'results'])
+        data = self.client.get(url + '?group=day&cursor=').json()
+        self.assertEqual(
+            sum(row['payments'] for row in data['results']), 4)
+        data = self.client.get(url + '?limit=1&cursor=').json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIn('offset=1', data['next'])
+
+    def test_daily_totals(self):
+        data = self.client.get(
+            '/api/v1/accounts/user1/payments/totals/?group=day').json()
+        sbd = [row for row in data['results'] if row['token'] == 'SBD']
+        self.assertEqual(sum(row['payments'] for row in sbd), 3)
+        self.assertEqual(sbd[0]['day'], Block.objects.get(
+            num=7).created_at.date().isoformat())
+
+    def test_post_totals(self):
+        data = self.client.get(
+            '/api/v1/post_cache/user0/post-0/payments/').json()
+        self.assertEqual(data, [
+            {'token': 'SBD', 'amount': '3.250', 'payments': 3, 'accounts': 2},
+            {'token': 'STEEM', 'amount': '0.500', 'payments': 1,
+             'accounts': 1},
+        ])
+
+
+class RepliesTestCase(HiveTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # user1/post-1 <- a <- b <- c, and user1/post-1 <- d
+        parent = Post.objects.get(author='user1', permlink='post-1')
+        for permlink, parent_permlink, payout in (
+                ('a', 'post-1', 1), ('b', 'a', 1), ('c', 'b', 1),
+                ('d', 'post-1', 5)):
+            reply = create_post('user2', permlink, payout=Decimal(payout))
+            Post.objects.filter(pk=reply.pk).update(
+                parent=Post.objects.get(permlink=parent_permlink))
+
+    def permlinks(self, replies):
+        return [(reply['permlink'], self.permlinks(reply['replies']))
+                for reply in replies]
+
+    def test_tree(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(
+                '/api/v1/post_cache/user1/post-1/replies/').json()
+        self.assertEqual(data['count'], 4)
+        self.assertFalse(data['truncated'])
+        self.assertEqual(self.permlinks(data['replies']), [
+            ('a', [('b', [('c', [])])]), ('d', [])])
+
+    def test_ordering_and_bounds(self):
+        data = self.client.get(
+            '/api/v1/post_cache/user1/post-1/replies/'
+            '?ordering=payout&depth=2').json()
+        self.assertEqual(self.permlinks(data['replies']), [
+            ('d', []), ('a', [('b', [])])])
+        data = self.client.get(
+            '/api/v1/post_cache/user1/post-1/replies/?limit=3').json()
+        self.assertTrue(data['truncated'])
+        self.assertEqual(self.permlinks(data['replies']), [
+            ('a', [('b', [])]), ('d', [])])
+
+    def test_invalid_ordering(self):
+        response = self.client.get(
+            '/api/v1/post_cache/user1/post-1/replies/?ordering=hot')
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkTestCase(HiveTestCase):
+
+    def test_every_endpoint_has_a_scenario(self):
+        names = get_url_names() - set(SKIPPED)
+        self.assertEqual(names - set(SCENARIOS) - set(BODIES), set())
+
+    @mock.patch('hive.views.watcher.ensure_started')
+    def test_generate_and_benchmark(self, ensure_started):
+        # the fixtures' deferred foreign key checks would block the TRUNCATE
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        out = StringIO()
+        call_command('generate_dataset', accounts=50, posts=300, days=0.05,
+                     communities=3, flush=True, stdout=out)
+        self.assertEqual(Account.objects.count(), 50)
+        self.assertEqual(PostCache.objects.count(), 300)
+        self.assertTrue(Post.objects.filter(depth__gt=0).exists())
+        self.assertTrue(Member.objects.exists())
+
+        with tempfile.NamedTemporaryFile('r') as output:
+            call_command('benchmark_endpoints', requests=2,
+                         output=output.name, stdout=out)
+            results = json.load(output)['endpoints']
+        self.assertIn('post-cache-detail-replies', results)
+        self.assertEqual(
+            {name: result['errors'] for name, result in results.items()
+             if result['errors']}, {})
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.gettempdir(),
+    }})
+    def test_cold_runs_need_a_local_cache(self):
+        with self.assertRaisesMessage(CommandError, 'FileBasedCache'):
+            call_command('benchmark_endpoints', cold=True, stdout=StringIO())
+
+    def test_requests_has_to_be_positive(self):
+        with self.assertRaisesMessage(CommandError, '--requests'):
+            call_command('benchmark_endpoints', requests=0, stdout=StringIO())
+
+    def test_generated_rows_are_reproducible(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        rows = []
+        for _ in range(2):
+            call_command('generate_dataset', accounts=20, posts=50,
+                         days=0.01, communities=2, flush=True,
+                         stdout=StringIO())
+            rows.append([
+                list(model.objects.order_by('pk').values_list())
+                for model in (Block, PostCache, PostTag, Payment, Follow)])
+        self.assertEqual(rows[0], rows[1])
+        self.assertEqual(Block.objects.latest('num').created_at.isoformat(),
+                         '2019-01-01T00:00:00+00:00')
+
+
+class ValuesSerializerTestCase(HiveTestCase):
+
+    def assertSameRepresentation(self, queryset, serializer_class):
+        expected = serializer_class(queryset, many=True).data
+        serializer = ValuesSerializer(serializer_class())
+        self.assertEqual(
+            serializer.to_representation_many(
+                queryset.values(*serializer.lookups)),
+            [dict(row) for row in expected])
+
+    def test_account(self):
+        self.assertSameRepresentation(Account.objects.all(), AccountSerializer)
+
+    def test_block(self):
+        self.assertSameRepresentation(Block.objects.all(), BlockSerializer)
+
+    def test_post_cache(self):
+        self.assertSameRepresentation(
+            PostCache.objects.all(), PostCacheSerializer)
+
+
+class PostVotesTestCase(HiveTestCase):
+    url = '/api/v1/post_cache/user1/post-1/votes/'
+
+    def setUp(self):
+        vote_cache.clear()
+        self.addCleanup(vote_cache.clear)
+        PostCache.objects.filter(author='user1').update(
+            updated_at=timezone.now(),
+            votes="alice,300,5000,25\nbob,-10,-100,25\ncarol,900,10000,25"
+                  "\ndave,50,200,25\nerin,600,7500,25")
+
+    def get(self, query=''):
+        return self.client.get(self.url + query)
+
+    def voters(self, query=''):
+        return [vote['voter'] for vote in self.get(query).json()['results']]
+
+    def test_pagination(self):
+        data = self.get('?limit=2').json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(
+            data['results'][0],
+            {'voter': 'alice', 'rshares': 300, 'percent': 5000})
+        self.assertIn('offset=2', data['next'])
+        data = self.get('?limit=2&offset=4').json()
+        self.assertEqual([vote['voter'] for vote in data['results']],
+                         ['erin'])
+        self.assertIsNone(data['next'])
+
+    def test_ordering(self):
+        self.assertEqual(self.voters('?ordering=-rshares'),
+                         ['carol', 'erin', 'alice', 'dave', 'bob'])
+        self.assertEqual(self.voters('?ordering=percent'),
+                         ['bob', 'dave', 'alice', 'erin', 'carol'])
+        self.assertEqual(self.get('?ordering=voter').status_code, 400)
+
+    def test_voter_filter(self):
+        self.assertEqual(self.voters('?voter=erin,bob,nobody'),
+                         ['bob', 'erin'])
+
+    def test_unknown_post(self):
+        response = self.client.get(
+            '/api/v1/post_cache/user1/nothing/votes/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_parsed_votes_are_cached(self):
+        self.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.voters('?voter=alice')), 1)
+
+
+class VotesTestCase(SimpleTestCase):
+
+    def test_iter_votes(self):
+        self.assertEqual(
+            list(iter_votes("alice,100,10000,25\nbob,-5,-100,30\n")),
+            [("alice", 100, 10000), ("bob", -5, -100)])
+        self.assertEqual(list(iter_votes("")), [])
+
+    def test_vote_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set(1, ("a",))
+        cache.set(2, ("b",))
+        cache.get(1)
+        cache.set(3, ("c",))
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), ("a",))
+
+
+@override_settings(TOWER_DB={
+    'REPLICAS': ['replica0', 'replica1'], 'MAX_LAG': 20,
+    'CHECK_INTERVAL': 5})
+class ReplicaRouterTestCase(SimpleTestCase):
+
+    def route(self, heads):
+        router = ReplicaRouter()
+        with mock.patch('hive.db.get_block_num', heads.get):
+            return router.db_for_read(Account), router
+
+    def test_skips_lagging_replicas(self):
+        alias, _ = self.route(
+            {'default': 100, 'replica0': 50, 'replica1': 90})
+        self.assertEqual(alias, 'replica1')
+
+    def test_skips_unreachable_replicas(self):
+        alias, router = self.route({'default': 100, 'replica1': 100})
+        self.assertEqual(alias, 'replica1')
+        self.assertEqual(router.healthy, ['replica1'])
+
+    def test_falls_back_to_primary(self):
+        alias, _ = self.route({'default': 100})
+        self.assertIsNone(alias)
+
+    def test_routes_only_hive_models(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(apps.get_model('auth.User')))
@@ -0,0 +1,95 @@
+import hashlib
+
+from django.conf import settings
+from django.db import connections
+
+from .cache import get_cache
+from .models import Post, PostCache
+from .serializers import FeedPostSerializer, ValuesSerializer
+
+REPLIES_MAX_SIZE = 1000
+# steemd's limit on the depth of a reply
+REPLIES_MAX_DEPTH = 255
+
+# sibling order of each ?ordering= value, post_id breaks the ties
+REPLY_ORDERINGS = {
+    'created': 'created_at ASC',
+    'votes': 'total_votes DESC',
+    'payout': 'payout DESC',
+}
+
+REPLIES_SQL = """
+WITH RECURSIVE tree (id, parent_id, level) AS (
+    SELECT id, parent_id, 1 FROM {posts}
+    WHERE parent_id = %s AND NOT is_deleted
+  UNION ALL
+    SELECT reply.id, reply.parent_id, tree.level + 1
+    FROM {posts} reply JOIN tree ON reply.parent_id = tree.id
+    WHERE NOT reply.is_deleted AND tree.level < %s
+)
+SELECT tree.parent_id, {columns} FROM tree
+JOIN {posts_cache} cache ON cache.post_id = tree.id
+ORDER BY tree.level, {ordering}, cache.post_id
+LIMIT %s
+"""
+
+
+def _fetch_replies(root_id, ordering, max_depth, max_size):
+    """
+    Returns the (parent id, serialized post) pairs of the replies in the
+    subtree, level by level, with a single recursive query.
+    """
+    serializer = ValuesSerializer(FeedPostSerializer())
+    lookups = serializer.lookups
+    opts = PostCache._meta
+    columns = ', '.join('cache.%s AS %s' % (
+        opts.get_field(lookup).column, lookup) for lookup in lookups)
+    sql = REPLIES_SQL.format(
+        posts=Post._meta.db_table, posts_cache=opts.db_table,
+        columns=columns, ordering='cache.' + REPLY_ORDERINGS[ordering])
+    with connections[PostCache.objects.all().db].cursor() as cursor:
+        cursor.execute(sql, [root_id, max_depth, max_size])
+        rows = cursor.fetchall()
+    posts = serializer.to_representation_many(
+        [dict(zip(lookups, row[1:])) for row in rows])
+    return [(row[0], post) for row, post in zip(rows, posts)]
+
+
+def get_replies(root, ordering='created', max_depth=None,
+                max_size=REPLIES_MAX_SIZE):
+    """
+    Returns the replies under the root post (a dict with post_id,
+    updated_at and children) as a nested tree.
+
+    Levels are fetched top down, so a bounded tree keeps the replies
+    closest to the root. Trees are cached until the root is edited or gets
+    a new reply, as both change its updated_at or children.
+    """
+    key = 'tower:replies:%s' % hashlib.md5(repr((
+        root['post_id'], root['updated_at'], root['children'], ordering,
+        max_depth, max_size)).encode('utf-8')).hexdigest()
+    cache = get_cache()
+    tree = cache.get(key)
+    if tree is not None:
+        return tree
+
+    # one extra row tells whether the tree was cut
+    replies = _fetch_replies(
+        root['post_id'], ordering, max_depth or REPLIES_MAX_DEPTH,
+        max_size + 1)
+    nodes = {root['post_id']: {'replies': []}}
+    for parent_id, post in replies[:max_size]:
+        parent = nodes.get(parent_id)
+        # the parent isn't in hive_posts_cache yet
+        if parent is None:
+            continue
+        post['replies'] = []
+        nodes[post['post_id']] = post
+        parent['replies'].append(post)
+    tree = {
+        'count': len(nodes) - 1,
+        'truncated': len(replies) > max_size,
+        'replies': nodes[root['post_id']]['replies'],
+    }
+    cache.set(key, tree, settings.TOWER_CACHE['TIMEOUT'])
+    return tree
@@ -1,10 +1,11 @@
 from rest_framework import routers
 
 from .views import (
-    AccountViewSet, BlockViewSet
+    AccountViewSet, BlockViewSet, CommunityViewSet
 )
 
 
 router = routers.DefaultRouter()
 router.register(r'accounts', AccountViewSet, base_name='accounts')
 router.register(r'blocks', BlockViewSet, base_name='blocks')
+router.register(r'communities', CommunityViewSet, base_name='communities')
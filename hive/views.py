@@ -1,31 +1,141 @@
-from django.http import Http404
-from django.db import connection
+import math
+from collections import OrderedDict
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .filters import AccountFilter, TowerFilterBackend, TowerOrderingFilter
-from .models import Account, Block, Post, PostCache, State, Reblog, PostTag
-from .pagination import TowerLimitedPagination
+from .filters import (
+    AccountFilter, BlockFilter, TowerFilterBackend, TowerOrderingFilter
+)
+from .models import (
+    Account, Block, Community, FeedCache, Member, Modlog, Post, PostCache,
+    State, Reblog, PostTag
+)
+from .blocks import get_block_contents
+from .cache import CachedResponseMixin
+from .constants import FOLLOW_STATE_FOLLOWING, FOLLOW_STATE_MUTE
+from .events import iter_sse, watcher
+from .guardrails import QueryCostMixin
+from .pagination import (
+    TowerCursorPagination, TowerLimitedPagination, TowerPagination
+)
+from .payments import (
+    PAYMENT_DIRECTIONS, account_payment_totals, account_payments,
+    post_payment_totals
+)
 from .serializers import (
     AccountSerializer, BlockSerializer, PostCacheSerializer,
-    PostSerializer, HiveStateSerializer,
-    AccountFollowerSerializer, AccountFollowingSerializer,
-    AccountMuterSerializer, AccountMutingSerializer,
-    ReblogSerializer
+    PostSerializer, HiveStateSerializer, CommunitySerializer,
+    DailyPaymentTotalSerializer, FeedSerializer, FollowSerializer,
+    MemberSerializer, ModlogSerializer, PaymentSerializer,
+    PaymentTotalSerializer, PostBatchSerializer, PostPaymentTotalSerializer,
+    ReblogSerializer, ValuesSerializer, get_related_paths
 )
+from .rankings import RANKING_SCOPES, get_ranking
+from .search import search_posts
+from .streaming import StreamingMixin
+from .tags import filter_by_tags
+from .threads import REPLIES_MAX_SIZE, REPLY_ORDERINGS, get_replies
+from .votes import get_votes
 
 
-class AccountViewSet(viewsets.ReadOnlyModelViewSet):
+class EagerLoadingMixin:
+    """
+    Derives select_related/prefetch_related from the serializer of the
+    view, so nested serializers don't fire one query per row.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch = get_related_paths(self.get_serializer())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class ValuesListMixin:
+    """
+    Serves list responses from QuerySet.values() rows through a
+    ValuesSerializer built from the view's serializer. The output is the
+    same, without instantiating a model and a serializer per row.
+
+    Together with StreamingMixin, ?stream=ndjson or ?stream=csv exports
+    the whole filtered and ordered list.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if isinstance(self, StreamingMixin) and self.get_stream_format():
+            serializer = ValuesSerializer(self.get_serializer())
+            return self.stream_response(
+                queryset.values(*serializer.lookups), serializer)
+        return self.values_response(queryset)
+
+    def values_response(self, queryset, serializer=None):
+        serializer = ValuesSerializer(serializer or self.get_serializer())
+        queryset = queryset.values(*serializer.lookups)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.to_representation_many(page))
+        return Response(serializer.to_representation_many(queryset))
+
+    def values_by_key(self, queryset, key_fields):
+        """
+        Returns the serialized rows of the queryset keyed by the tuple of
+        their key_fields.
+        """
+        serializer = ValuesSerializer(self.get_serializer())
+        lookups = serializer.lookups
+        lookups += [f for f in key_fields if f not in lookups]
+        rows = list(queryset.values(*lookups))
+        return {
+            tuple(row[f] for f in key_fields): data for row, data in zip(
+                rows, serializer.to_representation_many(rows))
+        }
+
+    def batch_response(self, queryset, keys, key_fields):
+        """
+        Resolves all the keys with one query and returns the rows in the
+        requested order. Keys without a row are returned as null and
+        listed under not_found.
+        """
+        rows = self.values_by_key(queryset, key_fields)
+        results, not_found = [], []
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                not_found.append(dict(zip(key_fields, key)))
+            results.append(row)
+        return Response(OrderedDict([
+            ('results', results),
+            ('not_found', not_found),
+        ]))
+
+
+class AccountViewSet(CachedResponseMixin, EagerLoadingMixin, QueryCostMixin,
+                     ValuesListMixin, StreamingMixin,
+                     viewsets.ReadOnlyModelViewSet):
     """
     retrieve:
     Return the given account by name.
 
     list:
-    Return a list of all the existing steem accounts.
+    Return a list of all the existing steem accounts. Pass ?names=a,b,c
+    to look up several accounts at once, in the given order, or
+    ?stream=ndjson / ?stream=csv to export the whole filtered list.
+    ?name__startswith=<prefix>&ordering=name serves name typeahead.
     """
 
     queryset = Account.objects.all()
@@ -34,6 +144,7 @@ class AccountViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_value_regex = '[^/]+'
     filter_backends = (TowerFilterBackend, TowerOrderingFilter)
     ordering_fields = (
+        'name',
         'vote_weight',
         'proxy_weight',
         'reputation',
@@ -45,38 +156,108 @@ class AccountViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('name',)
     filter_fields = ('location', 'name', 'reputation')
     filterset_class = AccountFilter
+    indexed_fields = ('id', 'name', 'vote_weight')
+    batch_max_size = 100
 
-    @action(detail=True, methods=["get"])
+    def list(self, request, *args, **kwargs):
+        names = request.query_params.get("names")
+        if names is None:
+            return super().list(request, *args, **kwargs)
+        names = [name.strip() for name in names.split(",") if name.strip()]
+        if len(names) > self.batch_max_size:
+            raise ValidationError({"names": "At most %s names can be "
+                                            "requested at once." %
+                                            self.batch_max_size})
+        queryset = self.get_queryset().filter(name__in=set(names))
+        return self.batch_response(
+            queryset, [(name,) for name in names], ('name',))
+
+    def _follow_response(self, state, incoming):
+        follows = self.get_object().follows(state, incoming).order_by(
+            "-created_at")
+        if self.get_stream_format():
+            return self.stream_response(follows, FollowSerializer())
+        page = self.paginate_queryset(follows)
+        serializer = FollowSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
     def followers(self, *args, **kwargs):
         """
-        Returns the related account's active followers.
+        Returns the related account's active followers, newest first.
+        Pass ?stream=ndjson or ?stream=csv to stream the whole list.
         """
-        serializer = AccountFollowerSerializer(self.get_object())
-        return Response(serializer.data)
+        return self._follow_response(FOLLOW_STATE_FOLLOWING, incoming=True)
 
-    @action(detail=True, methods=["get"])
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
     def following(self, *args, **kwargs):
         """
-        Returns the related account's active followings.
+        Returns the related account's active followings, newest first.
+        Pass ?stream=ndjson or ?stream=csv to stream the whole list.
         """
-        serializer = AccountFollowingSerializer(self.get_object())
-        return Response(serializer.data)
+        return self._follow_response(FOLLOW_STATE_FOLLOWING, incoming=False)
 
-    @action(detail=True, methods=["get"])
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
     def muters(self, *args, **kwargs):
         """
-        Returns the related account's active muters
+        Returns the related account's active muters, newest first.
+        Pass ?stream=ndjson or ?stream=csv to stream the whole list.
         """
-        serializer = AccountMuterSerializer(self.get_object())
-        return Response(serializer.data)
+        return self._follow_response(FOLLOW_STATE_MUTE, incoming=True)
 
-    @action(detail=True, methods=["get"])
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
     def muting(self, *args, **kwargs):
         """
-        Returns the related account's active mutings.
+        Returns the related account's active mutings, newest first.
+        Pass ?stream=ndjson or ?stream=csv to stream the whole list.
         """
-        serializer = AccountMutingSerializer(self.get_object())
-        return Response(serializer.data)
+        return self._follow_response(FOLLOW_STATE_MUTE, incoming=False)
+
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
+    def feed(self, *args, **kwargs):
+        """
+        Returns the home feed of the user from hivemind's feed cache, the
+        posts and reblogs of the followed accounts, newest first.
+        """
+        feed = FeedCache.objects.filter(
+            account_id=self.get_object().id).order_by("-created_at")
+        return self.values_response(feed, FeedSerializer())
+
+    @action(detail=True, methods=["get"],
+            pagination_class=TowerCursorPagination)
+    def payments(self, request, *args, **kwargs):
+        """
+        Returns the payments (post promotions) sent and received by the
+        user, newest first. ?direction=sent or ?direction=received
+        narrows them down.
+        """
+        direction = request.query_params.get("direction")
+        if direction is not None and direction not in PAYMENT_DIRECTIONS:
+            raise ValidationError({"direction": "Supported: %s" % ", ".join(
+                sorted(PAYMENT_DIRECTIONS))})
+        payments = account_payments(self.get_object(), direction)
+        return self.values_response(payments, PaymentSerializer())
+
+    @action(detail=True, methods=["get"], url_path="payments/totals",
+            pagination_class=TowerPagination)
+    def payment_totals(self, request, *args, **kwargs):
+        """
+        Returns the amounts sent and received by the user per token, or
+        per day and token, newest first, with ?group=day.
+        """
+        group = request.query_params.get("group", "token")
+        if group not in ("token", "day"):
+            raise ValidationError({"group": "Supported: day, token"})
+        totals = account_payment_totals(
+            self.get_object(), by_day=group == "day")
+        serializer = DailyPaymentTotalSerializer() if group == "day" \
+            else PaymentTotalSerializer()
+        return self.values_response(totals, serializer)
 
     @action(detail=True, methods=["get"])
     def reblogs(self, *args, **kwargs):
@@ -92,21 +273,104 @@ class AccountViewSet(viewsets.ReadOnlyModelViewSet):
             serializer = ReblogSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-class BlockViewSet(viewsets.ReadOnlyModelViewSet):
+class BlockViewSet(CachedResponseMixin, EagerLoadingMixin, QueryCostMixin,
+                   ValuesListMixin, StreamingMixin,
+                   viewsets.ReadOnlyModelViewSet):
     """
     retrieve:
     Return the block details by block number.
 
     list:
-    Return a list of all blocks in the blockchain.
+    Return a list of all blocks in the blockchain. Pass ?stream=ndjson or
+    ?stream=csv to export the whole list.
     """
     queryset = Block.objects.all()
     serializer_class = BlockSerializer
-    filter_backends = (TowerOrderingFilter,)
-    ordering_fields = ('txs', 'ops')
+    filter_backends = (TowerFilterBackend, TowerOrderingFilter)
+    filterset_class = BlockFilter
+    ordering_fields = ('num', 'txs', 'ops')
+    indexed_fields = ('num', 'hash')
+    contents_max_blocks = 1000
+
+    def _with_contents(self, blocks):
+        contents = get_block_contents(blocks)
+        serializer = self.get_serializer()
+        return [
+            dict(serializer.to_representation(block), **contents[block.num])
+            for block in blocks]
+
+    @action(detail=True, methods=["get"], url_path="contents")
+    def block_contents(self, *args, **kwargs):
+        """
+        Returns the block with the posts, payments and reblogs it contains.
+        """
+        return Response(self._with_contents([self.get_object()])[0])
+
+    @action(detail=False, methods=["get"])
+    def contents(self, request, *args, **kwargs):
+        """
+        Returns the blocks from ?from_num= to ?to_num= (at most 1000), each
+        with the posts, payments and reblogs it contains, in four queries.
+        """
+        try:
+            from_num = int(request.query_params["from_num"])
+            to_num = int(request.query_params.get("to_num", from_num))
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {"from_num": "A from_num (and to_num) block number is "
+                             "required."})
+        if not 0 <= to_num - from_num < self.contents_max_blocks:
+            raise ValidationError(
+                {"to_num": "At most %s blocks can be requested at once." %
+                           self.contents_max_blocks})
+        blocks = list(Block.objects.filter(
+            num__range=(from_num, to_num)).order_by("num"))
+        return Response(self._with_contents(blocks))
+
+
+class CommunityViewSet(CachedResponseMixin, EagerLoadingMixin,
+                       ValuesListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    retrieve:
+    Return the given community by name, with its subscriber count, post
+    count and pending payout.
+
+    list:
+    Return a list of the communities, with their subscriber count, post
+    count and pending payout.
+    """
+    queryset = Community.objects.all()
+    serializer_class = CommunitySerializer
+    lookup_field = 'name'
+    lookup_value_regex = '[^/]+'
+    filter_backends = (TowerFilterBackend, TowerOrderingFilter)
+    filter_fields = ('lang', 'type_id', 'is_nsfw')
+    ordering_fields = ('name', 'created_at')
+    ordering = ('name',)
+    pagination_class = TowerCursorPagination
+
+    @action(detail=True, methods=["get"])
+    def members(self, *args, **kwargs):
+        """
+        Returns the members of the community with their roles, by name.
+        """
+        members = Member.objects.filter(
+            community=self.get_object()).order_by("account")
+        return self.values_response(members, MemberSerializer())
 
+    @action(detail=True, methods=["get"])
+    def modlog(self, *args, **kwargs):
+        """
+        Returns the moderation log of the community, newest first.
+        """
+        modlog = Modlog.objects.filter(
+            community=self.get_object()).order_by("-created_at")
+        return self.values_response(modlog, ModlogSerializer())
 
-class PostCacheViewSet(viewsets.ReadOnlyModelViewSet):
+
+class PostCacheViewSet(CachedResponseMixin, EagerLoadingMixin, QueryCostMixin,
+                       ValuesListMixin, StreamingMixin,
+                       viewsets.ReadOnlyModelViewSet):
     """
     retrieve:
     Return the post_cache object by id.
@@ -118,17 +382,75 @@ class PostCacheViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = PostCacheSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filter_fields = ('author', 'permlink')
+    ordering_fields = (
+        'post_id', 'created_at', 'updated_at', 'payout_at', 'payout',
+        'promoted', 'sc_trend', 'sc_hot', 'children', 'total_votes',
+        'up_votes', 'rshares', 'author_rep',
+    )
+    # permlink is only indexed after author, ?permlink= alone is a scan
+    indexed_fields = ('post_id', 'post', 'author')
     pagination_class = TowerLimitedPagination
+    heavy_fields = ('body', 'votes', 'json', 'raw_json')
+    projected_actions = (
+        'list', 'retrieve', 'filter_by_tags', 'batch', 'ranked', 'search')
+    batch_max_size = 100
+    ranking = None
+
+    def get_field_projection(self):
+        """
+        Returns the fields requested with ?fields= and ?exclude= (comma
+        separated), or None when the action serializes the whole row.
+        List views leave the heavy TEXT columns out unless they are
+        requested explicitly.
+        """
+        if self.action not in self.projected_actions:
+            return None
+        if hasattr(self, '_field_projection'):
+            return self._field_projection
+
+        available = list(PostCacheSerializer().fields)
+        params = self.request.query_params
+        requested = [f for f in params.get('fields', '').split(',') if f]
+        excluded = [f for f in params.get('exclude', '').split(',') if f]
+        unknown = set(requested + excluded) - set(available)
+        if unknown:
+            raise ValidationError({
+                'fields': 'Unknown fields: %s' % ", ".join(sorted(unknown))})
+
+        if requested:
+            fields = [f for f in available if f in requested]
+        elif self.action == 'retrieve':
+            fields = available
+        else:
+            fields = [f for f in available if f not in self.heavy_fields]
+        self._field_projection = [f for f in fields if f not in excluded]
+        return self._field_projection
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_field_projection()
+        if fields is not None:
+            model_fields = {f.name for f in PostCache._meta.concrete_fields}
+            queryset = queryset.only(
+                PostCache._meta.pk.name,
+                *[f for f in fields if f in model_fields])
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_field_projection()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
 
     def _get_by_author_permlink(self, **kwargs):
         try:
             try:
-                post_cache = PostCache.objects.get(
+                post_cache = self.get_queryset().get(
                     author=kwargs["author"],
                     permlink=kwargs["permlink"],
                 )
             except KeyError as e:
-                post_cache = PostCache.objects.get(
+                post_cache = self.get_queryset().get(
                     pk=kwargs.get("pk"),
                 )
         except PostCache.DoesNotExist:
@@ -140,25 +462,158 @@ class PostCacheViewSet(viewsets.ReadOnlyModelViewSet):
         post_cache = self._get_by_author_permlink(**kwargs)
         if not post_cache:
             raise Http404
-        return Response(PostCacheSerializer(post_cache).data)
+        return Response(self.get_serializer(post_cache).data)
 
 
+    @action(detail=False, methods=["get"])
+    def search(self, request, *args, **kwargs):
+        """Full-text search over the titles and bodies of the posts, best
+        matches first, with their search_rank. Example: ?q=steem photography
+        """
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "A search text is required."})
+        serializer = ValuesSerializer(self.get_serializer())
+        queryset = search_posts(text, self.get_queryset()).values(
+            *serializer.lookups, 'search_rank')
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response([
+            dict(serializer.to_representation(row),
+                 search_rank=row['search_rank'])
+            for row in page])
+
+    def ranked(self, request, *args, **kwargs):
+        """Returns a ranked list of top level posts (trending, hot, created,
+        promoted or payout), served from a snapshot of the top posts taken
+        at the head block.
+
+        ?tag=, ?category= and ?community= narrow the list down. The
+        snapshot is paginated with offsets, ?cursor= is rejected.
+        """
+        params = request.query_params
+        if self.paginator.cursor_query_param in params:
+            raise ValidationError({
+                self.paginator.cursor_query_param:
+                    'Rankings are paginated with offsets, follow the next '
+                    'link (?%s=) instead.' % self.paginator.offset_query_param})
+        scope = {name: params[name] for name in RANKING_SCOPES
+                 if params.get(name)}
+        post_ids = get_ranking(self.ranking, **scope)
+        page = self.paginate_queryset(post_ids)
+        rows = self.values_by_key(
+            self.get_queryset().filter(post_id__in=page).order_by(),
+            ('post_id',))
+        return self.get_paginated_response(
+            [rows[(post_id,)] for post_id in page if (post_id,) in rows])
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request, *args, **kwargs):
+        """Returns several posts at once, in the requested order. Example
+        body: {"posts": [{"author": "emrebeyler", "permlink": "tower"}]}
+        Posts that don't exist are returned as null and listed under
+        not_found.
+        """
+        serializer = PostBatchSerializer(
+            data=request.data, context={'max_size': self.batch_max_size})
+        serializer.is_valid(raise_exception=True)
+        keys = [(post['author'], post['permlink'])
+                for post in serializer.validated_data['posts']]
+        condition = Q()
+        for author, permlink in set(keys):
+            condition |= Q(author=author, permlink=permlink)
+        queryset = self.get_queryset().filter(condition) if keys \
+            else self.get_queryset().none()
+        return self.batch_response(queryset, keys, ('author', 'permlink'))
+
+    vote_orderings = {
+        'rshares': (1, False), '-rshares': (1, True),
+        'percent': (2, False), '-percent': (2, True),
+    }
+
     @action(detail=True, methods=["get"])
     def votes(self, *args, **kwargs):
-        """Returns the vote(r) information of the post.
+        """Returns the vote(r) information of the post, paginated.
+
+        ?voter=<name>: only the votes of the given voter(s), comma separated.
+        ?ordering=[-]rshares|[-]percent: sort the votes, default is the
+        voting order.
         """
-        response = []
-        obj = self._get_by_author_permlink(**kwargs)
-        if not obj.votes:
-            return response
-        votes = obj.votes.split("\n")
-        for row in votes:
-            # ignore the reputation
-            # https://github.com/steemit/hivemind/issues/175
-            voter, rshares, percent, _ = row.split(",")
-            response.append(
-                {"voter": voter, "rshares": rshares, "percent": percent})
-        return Response(response)
+        if "author" in kwargs:
+            lookup = {"author": kwargs["author"],
+                      "permlink": kwargs["permlink"]}
+        else:
+            lookup = {"pk": kwargs.get("pk")}
+        post = PostCache.objects.filter(**lookup).values(
+            'post_id', 'updated_at').first()
+        if not post:
+            raise Http404
+        votes = get_votes(post['post_id'], post['updated_at'])
+
+        voters = self.request.query_params.get("voter")
+        if voters:
+            voters = set(voters.split(","))
+            votes = [vote for vote in votes if vote[0] in voters]
+        ordering = self.request.query_params.get("ordering")
+        if ordering:
+            if ordering not in self.vote_orderings:
+                raise ValidationError({"ordering": "Supported: %s" % ", ".join(
+                    self.vote_orderings)})
+            index, reverse = self.vote_orderings[ordering]
+            votes = sorted(votes, key=itemgetter(index), reverse=reverse)
+
+        page = self.paginate_queryset(votes)
+        return self.get_paginated_response([
+            {"voter": voter, "rshares": rshares, "percent": percent}
+            for voter, rshares, percent in page])
+
+    @action(detail=True, methods=["get"])
+    def payments(self, *args, **kwargs):
+        """Returns the promotion payments of the post per token, with
+        the number of payments and of paying accounts.
+        """
+        post_id = PostCache.objects.filter(
+            author=kwargs["author"], permlink=kwargs["permlink"]).values_list(
+            'post_id', flat=True).first()
+        if post_id is None:
+            raise Http404
+        return Response(ValuesSerializer(
+            PostPaymentTotalSerializer()).to_representation_many(
+            post_payment_totals(post_id)))
+
+    @action(detail=True, methods=["get"])
+    def replies(self, request, *args, **kwargs):
+        """Returns the discussion tree under the post, each reply with its
+        own replies nested.
+
+        ?ordering=created|votes|payout: sort the replies of each post,
+        default is oldest first.
+        ?depth=<n>: only the first n levels of replies.
+        ?limit=<n>: at most n replies (1000 by default), the levels
+        closest to the post first.
+        """
+        post = PostCache.objects.filter(
+            author=kwargs["author"], permlink=kwargs["permlink"]).values(
+            'post_id', 'updated_at', 'children').first()
+        if not post:
+            raise Http404
+        params = request.query_params
+        ordering = params.get("ordering", "created")
+        if ordering not in REPLY_ORDERINGS:
+            raise ValidationError({"ordering": "Supported: %s" % ", ".join(
+                sorted(REPLY_ORDERINGS))})
+        try:
+            depth = int(params.get("depth", 0)) or None
+            limit = int(params.get("limit", REPLIES_MAX_SIZE))
+        except ValueError:
+            raise ValidationError(
+                {"depth": "depth and limit have to be numbers."})
+        if depth is not None and depth < 0:
+            raise ValidationError({"depth": "depth can't be negative."})
+        if not 0 < limit <= REPLIES_MAX_SIZE:
+            raise ValidationError({"limit": "limit has to be between 1 and "
+                                            "%s." % REPLIES_MAX_SIZE})
+        return Response(get_replies(
+            post, ordering=ordering, max_depth=depth, max_size=limit))
 
     @action(detail=True, methods=["get"])
     def reblogs(self, *args, **kwargs):
@@ -174,37 +629,27 @@ class PostCacheViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["get", ])
     def filter_by_tags(self, *args, **kwargs):
-        """Filter the result set by tags. Example: ?[]exact=python&[]
-        exact=programming&[]exact=utopian-io
+        """Filter the result set by tags, newest first.
+
+        ?[]exact=<tag> (or []all): posts having all of the given tags.
+        ?[]any=<tag>: posts having at least one of the given tags.
+        ?[]none=<tag>: posts having none of the given tags.
+
+        Example: ?[]exact=python&[]exact=programming&[]none=utopian-io
         """
-        exact_matches = self.request.query_params.getlist("[]exact", [])
-        if not len(exact_matches):
+        params = self.request.query_params
+        all_tags = params.getlist("[]exact", []) + params.getlist("[]all", [])
+        any_tags = params.getlist("[]any", [])
+        none_tags = params.getlist("[]none", [])
+        if not all_tags and not any_tags:
             raise Http404
-        if len(exact_matches) == 1:
-            # optimize the query if there is only one tag requested.
-            post_cache_objects = PostCache.objects.filter(
-                post__posttag__tag=exact_matches[0])
-        else:
-            with connection.cursor() as cursor:
-                subqueries = []
-                for _ in exact_matches:
-                    subqueries.append("SELECT post_id " \
-                               "FROM hive_post_tags " \
-                               "WHERE tag = %s")
-                subquery = " INTERSECT ".join(subqueries)
-                subquery = "(%s)" % subquery
-                cursor.execute(subquery, exact_matches)
-                post_ids = [p[0] for p in cursor.fetchall()]
-
-                post_cache_objects = PostCache.objects.filter(
-                    pk__in=post_ids).order_by("-created_at")
-        page = self.paginate_queryset(post_cache_objects)
-        if page is not None:
-            serializer = PostCacheSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        post_cache_objects = filter_by_tags(
+            self.get_queryset(), all_tags=all_tags, any_tags=any_tags,
+            none_tags=none_tags)
+        return self.values_response(post_cache_objects)
 
 
-class PostViewSet(viewsets.ReadOnlyModelViewSet):
+class PostViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -242,3 +687,59 @@ class StateView(APIView):
         state = State.objects.last()
         serializer = HiveStateSerializer(state)
         return Response(serializer.data)
+
+
+class BlockEventsView(APIView):
+    """
+    Long-polls for new blocks, with the posts they contain.
+
+    Returns the blocks after ?after_block= as soon as there are any, or an
+    empty list after ?timeout= seconds (25 at most). Without after_block,
+    the head block is returned right away. Only the last blocks are kept,
+    use /api/v1/blocks/contents/ to fill larger gaps.
+    """
+
+    def get_after_block(self, request):
+        after_block = request.query_params.get(
+            'after_block', request.META.get('HTTP_LAST_EVENT_ID'))
+        if after_block in (None, ''):
+            return None
+        try:
+            return int(after_block)
+        except ValueError:
+            raise ValidationError({'after_block': 'A block number is required.'})
+
+    def get(self, request, format=None):
+        config = settings.TOWER_EVENTS
+        after_block = self.get_after_block(request)
+        try:
+            timeout = float(request.query_params.get(
+                'timeout', config['LONG_POLL_TIMEOUT']))
+        except ValueError:
+            raise ValidationError({'timeout': 'A number is required.'})
+        if not math.isfinite(timeout):
+            raise ValidationError({'timeout': 'A finite number is required.'})
+        watcher.ensure_started()
+        return Response(watcher.wait(
+            after_block, min(max(timeout, 0), config['LONG_POLL_TIMEOUT'])))
+
+
+class BlockStreamView(BlockEventsView):
+    """
+    Streams new blocks, with the posts they contain, as server-sent
+    events. Reconnecting clients resume from their Last-Event-ID. The
+    stream is closed after a few minutes so that workers are recycled,
+    EventSource clients reconnect on their own.
+    """
+
+    def get(self, request, format=None):
+        config = settings.TOWER_EVENTS
+        after_block = self.get_after_block(request)
+        watcher.ensure_started()
+        response = StreamingHttpResponse(
+            iter_sse(after_block, config['STREAM_DURATION'],
+                     config['LONG_POLL_TIMEOUT']),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
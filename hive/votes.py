@@ -0,0 +1,42 @@
+from .cache import LRUCache
+from .models import PostCache
+
+VOTES_CACHE_SIZE = 512
+
+vote_cache = LRUCache(VOTES_CACHE_SIZE)
+
+
+def iter_votes(text):
+    """
+    Yields (voter, rshares, percent) tuples from a hive_posts_cache.votes
+    blob, one line at a time without splitting the whole blob first.
+    """
+    start, length = 0, len(text)
+    while start < length:
+        end = text.find("\n", start)
+        if end == -1:
+            end = length
+        line = text[start:end]
+        start = end + 1
+        if not line:
+            continue
+        # ignore the reputation
+        # https://github.com/steemit/hivemind/issues/175
+        voter, rshares, percent = line.split(",")[:3]
+        yield voter, int(rshares), int(percent)
+
+
+def get_votes(post_id, updated_at):
+    """
+    Returns the parsed votes of the post. Since hivemind rewrites the votes
+    blob along with updated_at, (post_id, updated_at) identifies a version
+    of it and the blob is only fetched and parsed on a cache miss.
+    """
+    key = (post_id, updated_at)
+    votes = vote_cache.get(key)
+    if votes is None:
+        text = PostCache.objects.filter(pk=post_id).values_list(
+            'votes', flat=True).first()
+        votes = tuple(iter_votes(text or ''))
+        vote_cache.set(key, votes)
+    return votes
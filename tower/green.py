@@ -0,0 +1,21 @@
+"""
+Gevent entry point for tower project.
+
+Serves the same WSGI application, with the standard library and psycopg2
+patched so that waiting on Postgres, on new blocks (long-poll and
+server-sent events) or on the network yields to the other requests
+instead of holding a thread. Requires gevent and psycogreen:
+
+    $ uwsgi --ini docker/uwsgi-gevent.ini
+    $ gunicorn -k gevent --worker-connections 1000 tower.green:application
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+
+patch_psycopg()
+
+from .wsgi import application  # noqa: E402,F401
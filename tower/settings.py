@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'hive.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hive.db.QueryTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'tower.urls'
@@ -80,6 +83,16 @@ WSGI_APPLICATION = 'tower.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds instead of being
+# reopened per request, and every statement is cancelled after
+# DB_STATEMENT_TIMEOUT milliseconds so a slow query can't hold a worker.
+
+DATABASE_OPTIONS = {
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 3)),
+    'options': '-c statement_timeout=%s' % int(
+        os.getenv('DB_STATEMENT_TIMEOUT', 15000)),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -88,9 +101,97 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASS'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': DATABASE_OPTIONS,
+    }
+}
+
+# Read replicas of the hivemind database, as comma separated host:port
+# pairs sharing the credentials of the primary. Reads of the hive models
+# are spread over the replicas that are at most MAX_LAG blocks behind.
+
+for i, replica in enumerate(filter(None, os.getenv(
+        'DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES['replica%s' % i] = dict(
+        DATABASES['default'], HOST=host, PORT=port,
+        TEST={'MIRROR': 'default'})
+
+# Exports (?stream=) read whole tables, their statements get
+# DB_EXPORT_STATEMENT_TIMEOUT milliseconds instead.
+
+TOWER_DB = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'MAX_LAG': int(os.getenv('DB_REPLICA_MAX_LAG', 20)),
+    'CHECK_INTERVAL': int(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5)),
+    'EXPORT_STATEMENT_TIMEOUT': int(
+        os.getenv('DB_EXPORT_STATEMENT_TIMEOUT', 600000)),
+}
+
+DATABASE_ROUTERS = ['hive.db.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+#
+# A per-process LRU cache by default. Point CACHE_BACKEND/CACHE_LOCATION to
+# memcached (or django-redis) to share cached responses across workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'tower'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
     }
 }
 
+# Response cache of the API viewsets. Entries are tagged with the head block
+# and stop being served once hivemind processes a new block.
+# TIMEOUTS overrides TIMEOUT per url name (e.g. 'post-cache-detail'), a
+# timeout of 0 disables caching for that endpoint.
+TOWER_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'HEAD_BLOCK_TTL': 1,
+    'TIMEOUTS': {},
+}
+
+# New blocks are pushed to long-poll and server-sent event clients by a
+# watcher thread per process. It polls hive_state every POLL_INTERVAL
+# seconds, or waits for a NOTIFY on CHANNEL when it is set.
+TOWER_EVENTS = {
+    'POLL_INTERVAL': 1,
+    'CHANNEL': os.getenv('EVENTS_CHANNEL'),
+    'BUFFER_SIZE': 100,
+    'LONG_POLL_TIMEOUT': 25,
+    'STREAM_DURATION': 300,
+}
+
+# Request metrics, exposed at /metrics. Each worker process writes its
+# numbers to DIR, which has to be shared by the workers. A sample of
+# PROFILE_SAMPLE_RATE requests is profiled and the profiles of those slower
+# than PROFILE_SLOW_SECONDS are written to PROFILE_DIR.
+TOWER_METRICS = {
+    'DIR': os.getenv(
+        'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tower-metrics')),
+    'FLUSH_INTERVAL': 5,
+    'PROFILE_SAMPLE_RATE': float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    'PROFILE_SLOW_SECONDS': float(os.getenv('PROFILE_SLOW_SECONDS', 1)),
+    'PROFILE_DIR': os.getenv(
+        'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'tower-profiles')),
+}
+
+# List requests that filter or order by unindexed columns are priced with
+# EXPLAIN and rejected when the planner's cost is over MAX_COST (0 turns
+# the check off).
+TOWER_GUARDRAILS = {
+    'MAX_COST': float(os.getenv('MAX_QUERY_COST', 1000000)),
+}
+
+TEST_RUNNER = 'hive.tests.HiveTestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -133,7 +234,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'hive.pagination.TowerPagination',
     'PAGE_SIZE': 100,
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'hive.renderers.TowerJSONRenderer',
     )
 }
 
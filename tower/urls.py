@@ -3,8 +3,11 @@ from django.contrib import admin
 from django.urls import path, include
 
 from hive.urls import router
-from hive.views import StateView
+from hive.views import BlockEventsView, BlockStreamView, StateView
 from hive.views import PostCacheViewSet
+from hive.metrics import metrics_view
+from hive.pagination import TowerLimitedCursorPagination, TowerPagination
+from hive.rankings import RANKINGS
 from rest_framework.documentation import include_docs_urls
 
 post_cache_detail = PostCacheViewSet.as_view({
@@ -17,15 +20,31 @@ post_cache_list = PostCacheViewSet.as_view({
 
 post_cache_detail_votes = PostCacheViewSet.as_view({
     'get': 'votes',
-})
+}, pagination_class=TowerPagination)
 
 post_cache_detail_reblogs = PostCacheViewSet.as_view({
     'get': 'reblogs',
 })
 
+post_cache_detail_payments = PostCacheViewSet.as_view({
+    'get': 'payments',
+})
+
+post_cache_detail_replies = PostCacheViewSet.as_view({
+    'get': 'replies',
+})
+
+post_cache_search = PostCacheViewSet.as_view({
+    'get': 'search',
+}, pagination_class=TowerPagination)
+
+post_cache_batch = PostCacheViewSet.as_view({
+    'post': 'batch',
+})
+
 post_cache_detail_filter_by_tags = PostCacheViewSet.as_view({
     'get': 'filter_by_tags',
-})
+}, pagination_class=TowerLimitedCursorPagination)
 
 
 post_detail = PostCacheViewSet.as_view({
@@ -37,10 +56,30 @@ post_list = PostCacheViewSet.as_view({
 })
 
 
+post_cache_rankings = [
+    path(
+        'api/v1/post_cache/%s/' % ranking,
+        PostCacheViewSet.as_view(
+            {'get': 'ranked'}, ranking=ranking,
+            pagination_class=TowerPagination),
+        name="post-cache-%s" % ranking)
+    for ranking in sorted(RANKINGS)
+]
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name="metrics"),
     path('api/v1/', include(router.urls)),
     path('api/v1/state/', StateView.as_view(), name="state"),
+    path(
+        'api/v1/state/blocks/',
+        BlockEventsView.as_view(),
+        name="state-blocks"),
+    path(
+        'api/v1/state/stream/',
+        BlockStreamView.as_view(),
+        name="state-stream"),
     path(
         'api/v1/post_cache/',
         post_cache_list,
@@ -61,10 +100,27 @@ urlpatterns = [
         'api/v1/post_cache/filter_by_tags/',
         post_cache_detail_filter_by_tags,
         name="post-cache-detail-filter-by-tags"),
+    *post_cache_rankings,
+    path(
+        'api/v1/post_cache/search/',
+        post_cache_search,
+        name="post-cache-search"),
+    path(
+        'api/v1/post_cache/batch/',
+        post_cache_batch,
+        name="post-cache-batch"),
     path(
         'api/v1/post_cache/<str:author>/<str:permlink>/reblogs/',
         post_cache_detail_reblogs,
         name="post-cache-detail-reblogs"),
+    path(
+        'api/v1/post_cache/<str:author>/<str:permlink>/payments/',
+        post_cache_detail_payments,
+        name="post-cache-detail-payments"),
+    path(
+        'api/v1/post_cache/<str:author>/<str:permlink>/replies/',
+        post_cache_detail_replies,
+        name="post-cache-detail-replies"),
     path(
         'api/v1/post_cache/<str:author>/<str:permlink>/votes/',
         post_cache_detail_votes,